@@ -4,17 +4,28 @@ Provides AI-powered coloring image generation, PDF storage, and usage tracking
 """
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Path as PathParam, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from contextlib import asynccontextmanager
 import os
-import json
+import sys
+import time
+import orjson
 import asyncio
+import aiohttp
+
+# pybase64 decodes with SIMD (SSSE3/AVX2/NEON) when installed; the
+# stdlib module is a drop-in fallback
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
+from anyio import to_thread as anyio_to_thread
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -25,9 +36,50 @@ from services.pdf_storage_service import PDFStorageService
 from utils.errors import APIError
 from utils.security import (
     validate_theme, validate_church_name, validate_prompt,
-    validate_int, validate_file_extension, sanitize_string
+    validate_int, validate_file_extension, sanitize_string,
+    verify_file_token
 )
 from utils.env_validation import validate_and_exit_on_error
+from utils.tracking import set_main_event_loop
+
+# Structured logging for error paths: logger.exception defers traceback
+# formatting to the handler (and its level), unlike print +
+# traceback.print_exc which walks frames and reads source lines eagerly
+import logging
+
+# Route all records through a queue so emitting a log line never blocks
+# a request thread on a slow stdout pipe; a background listener thread
+# does the actual formatting and writes
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_log_queue():
+    """
+    Swap the root handlers for a QueueHandler and start the listener
+
+    Called from the lifespan so it runs in each worker: with gunicorn's
+    preload_app the module imports in the master, and a listener thread
+    started at import would not survive the fork - workers would queue
+    records forever with nothing draining them.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    _log_listener = QueueListener(
+        log_queue, *root_logger.handlers, respect_handler_level=True
+    )
+    root_logger.handlers = [QueueHandler(log_queue)]
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+logger = logging.getLogger('kidschurch')
 
 # Load environment variables
 # Use explicit path to ensure .env is loaded from backend directory
@@ -38,6 +90,14 @@ else:
     # Fallback: try loading from current directory
     load_dotenv(override=True)
 
+# Configure logging after load_dotenv so LOG_LEVEL from .env applies;
+# an unrecognized value falls back to INFO instead of raising at import
+_log_level = logging.getLevelName(os.getenv('LOG_LEVEL', 'info').upper())
+logging.basicConfig(
+    level=_log_level if isinstance(_log_level, int) else logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s %(message)s'
+)
+
 # Validate environment variables on startup
 # This will exit if critical configuration is missing
 validate_and_exit_on_error()
@@ -52,17 +112,38 @@ pdf_storage_service = PDFStorageService()
 async def lifespan(app: FastAPI):
     """Handle application startup and shutdown"""
     # Startup
+    # Per-worker log queue: must start after fork, see _start_log_queue
+    _start_log_queue()
+
     # Store main event loop for thread-safe logging
-    from utils.tracking import set_main_event_loop
     loop = asyncio.get_running_loop()
     set_main_event_loop(loop)
     
     # Database service prints its own messages, so we just call initialize
     await database_service.initialize()
-    
+
+    # AI calls run via asyncio.to_thread; raise anyio's default thread
+    # limit (40) so slow LLM round-trips don't starve other to_thread work
+    try:
+        anyio_to_thread.current_default_thread_limiter().total_tokens = 64
+    except Exception as e:
+        print(f"⚠️  Could not raise thread limit: {e}")
+
+    # Shared HTTP session for preview-image downloads
+    # Reusing one session keeps connections (and DNS cache) warm across
+    # requests instead of paying TCP+TLS setup per upload
+    app.state.http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=30),
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+    )
+
     yield
-    
+
     # Shutdown
+    try:
+        await app.state.http.close()
+    except Exception as e:
+        print(f"⚠️  Error closing HTTP session: {e}")
     try:
         await database_service.close()
     except Exception as e:
@@ -72,12 +153,67 @@ app = FastAPI(
     title="Church Games API",
     description="AI-powered pamphlet generation for kids church",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson serializes responses ~5x faster than stdlib json; matters
+    # most for the paginated /api/pamphlets arrays
+    default_response_class=ORJSONResponse
 )
 
+# Rate-limit exemptions for internal probes (k8s/gcp health checks, etc.)
+# RATE_LIMIT_EXEMPT_CIDRS is a comma-separated list of networks, e.g.
+# "10.0.0.0/8,::1/128". Networks are parsed once at startup and per-IP
+# decisions are memoized so the hot key path stays O(1).
+from ipaddress import ip_address, ip_network
+
+_exempt_networks = []
+for _cidr in os.getenv('RATE_LIMIT_EXEMPT_CIDRS', '').split(','):
+    _cidr = _cidr.strip()
+    if _cidr:
+        try:
+            _exempt_networks.append(ip_network(_cidr, strict=False))
+        except ValueError:
+            print(f"⚠️  Ignoring invalid CIDR in RATE_LIMIT_EXEMPT_CIDRS: {_cidr}")
+
+_exempt_decisions = {}
+
+
+def get_rate_limit_key(request: Request) -> str:
+    """
+    Rate-limit key function: the client IP, or '' for allowlisted CIDRs.
+
+    slowapi skips a limit when the key is empty, so exempted probes never
+    touch rate-limit storage at all.
+    """
+    host = request.client.host if request.client else '127.0.0.1'
+    if not _exempt_networks:
+        return host
+    exempt = _exempt_decisions.get(host)
+    if exempt is None:
+        try:
+            exempt = any(ip_address(host) in net for net in _exempt_networks)
+        except ValueError:
+            exempt = False
+        if len(_exempt_decisions) < 1024:  # bound the cache against IP churn
+            _exempt_decisions[host] = exempt
+    return '' if exempt else host
+
+
 # Initialize rate limiter
 # Use IP address for rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# With the default in-memory storage each gunicorn worker counts requests
+# independently, so the effective per-IP limit is N_workers x the stated
+# value. Point RATE_LIMIT_STORAGE_URL at Redis to share a sliding window
+# across workers (requires the 'redis' package).
+rate_limit_storage = os.getenv('RATE_LIMIT_STORAGE_URL')
+if rate_limit_storage:
+    limiter = Limiter(
+        key_func=get_rate_limit_key,
+        storage_uri=rate_limit_storage,
+        strategy='moving-window',
+    )
+    print(f"✅ Rate limiting using shared storage: {rate_limit_storage.split('@')[-1]}")
+else:
+    limiter = Limiter(key_func=get_rate_limit_key)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -90,7 +226,6 @@ if cors_origins_env == '*' or not cors_origins_env:
         print("❌ ERROR: CORS_ORIGINS is set to '*' in production. This is a security risk!")
         print("   Please set CORS_ORIGINS to specific domain(s) in your .env file.")
         print("   Example: CORS_ORIGINS=https://kidschurch.bylwazi.co.za,https://www.kidschurch.bylwazi.co.za")
-        import sys
         sys.exit(1)
     else:
         print("⚠️  WARNING: CORS_ORIGINS is set to '*' (allows all origins).")
@@ -112,36 +247,156 @@ app.add_middleware(
     allow_credentials=cors_allow_credentials,
     allow_methods=['GET', 'POST', 'DELETE'],
     allow_headers=['Content-Type'],
-    max_age=3600,
+    # Browsers cap Access-Control-Max-Age (86400s on Chromium, 7200s on
+    # Firefox), so ask for the maximum instead of re-preflighting hourly
+    max_age=86400,
 )
 
 
+class CORSPreflightCacheMiddleware:
+    """
+    Mark CORS pre-flight responses as cacheable.
+
+    CORSMiddleware only sets Access-Control-Max-Age; adding Cache-Control
+    lets intermediate caches and the browser HTTP cache also skip the
+    pre-flight round-trip for warm clients.
+    """
+
+    _EXTRA_HEADERS = [
+        (b'cache-control', b'public, max-age=86400'),
+        (b'vary', b'Origin, Access-Control-Request-Headers'),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache_headers(message):
+            if message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                existing = {name for name, _ in message['headers']}
+                for name, value in self._EXTRA_HEADERS:
+                    if name not in existing:
+                        message['headers'].append((name, value))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
+
+
+# Added after CORSMiddleware so it wraps the pre-flight responses
+# CORSMiddleware generates
+app.add_middleware(CORSPreflightCacheMiddleware)
+
+
+# Serve PDFs/previews via nginx X-Accel-Redirect when enabled.
+# With USE_XACCEL=1, download/preview responses carry an X-Accel-Redirect
+# header and nginx streams the file with kernel sendfile() instead of the
+# bytes crossing the Python process (see nginx.example.conf).
+USE_XACCEL = os.getenv('USE_XACCEL', '0') == '1'
+XACCEL_PREFIX = os.getenv('XACCEL_PREFIX', '/_protected')
+
+# When set, download/preview URLs returned by the list endpoints carry an
+# HMAC-signed file path, letting those endpoints serve files with one
+# signature check instead of a MySQL round-trip per request
+SIGNED_URL_SECRET = os.getenv('SIGNED_URL_SECRET')
+
+# Cached directory listings for download/preview existence checks.
+# Repeated downloads of the same pamphlet become a set lookup instead of
+# a stat(2) per request; a listing is trusted only while the directory
+# mtime is unchanged, so uploads and deletes are picked up immediately.
+_known_paths = {}  # parent dir -> (mtime, {filenames})
+
+
+def _file_exists_cached(file_path) -> bool:
+    """Blocking existence check backed by per-directory listings (run via to_thread)"""
+    parent = os.path.dirname(str(file_path))
+    name = os.path.basename(str(file_path))
+    try:
+        dir_mtime = os.stat(parent).st_mtime
+    except OSError:
+        return False
+    cached = _known_paths.get(parent)
+    if cached is not None and cached[0] == dir_mtime:
+        return name in cached[1]
+    try:
+        entries = {entry.name for entry in os.scandir(parent)}
+    except OSError:
+        return False
+    _known_paths[parent] = (dir_mtime, entries)
+    return name in entries
+
+
+# Strong references to fire-and-forget tasks: the event loop holds only
+# a weak reference, so an otherwise-unreferenced task can be collected
+# before it runs. The done callback discards finished tasks.
+_background_tasks = set()
+
+
+def _spawn_background_task(coro):
+    """create_task with a strong reference held until the task finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+# Maximum upload size (PDFs)
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB read chunks
+
+
+async def read_upload(upload: UploadFile, max_bytes: int) -> bytes:
+    """
+    Read an UploadFile in chunks into a single buffer.
+
+    Enforces the size limit incrementally so oversized uploads are
+    rejected as soon as the limit is crossed, and avoids the extra
+    full-file copy of read() + BytesIO.
+    """
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise APIError('File size exceeds maximum allowed size (10MB)', 400)
+    return bytes(buffer)
+
+
 # Request Models
+# Length bounds mirror utils.security (validate_theme/validate_prompt) so
+# oversized payloads are rejected during C-level parsing, before the
+# Python sanitizers run on the string
 class ThemeRequest(BaseModel):
-    theme: str = Field(..., description="Theme for content generation")
+    theme: str = Field(..., min_length=1, max_length=255, description="Theme for content generation")
 
 class QuizRequest(BaseModel):
-    theme: str = Field(..., description="Theme for quiz questions")
+    theme: str = Field(..., min_length=1, max_length=255, description="Theme for quiz questions")
     num_questions: int = Field(default=10, ge=1, le=50, description="Number of questions")
 
 class CrosswordWordsRequest(BaseModel):
-    theme: str = Field(..., description="Theme for crossword words")
+    theme: str = Field(..., min_length=1, max_length=255, description="Theme for crossword words")
     num_words: int = Field(default=8, ge=3, le=20, description="Number of words")
 
 class ColoringImageRequest(BaseModel):
-    prompt: str = Field(..., description="Image generation prompt")
-    theme: str = Field(..., description="Theme for the image")
+    prompt: str = Field(..., min_length=1, max_length=500, description="Image generation prompt")
+    theme: str = Field(..., min_length=1, max_length=255, description="Theme for the image")
 
 class PamphletMetadata(BaseModel):
-    church_name: str
-    theme: str
+    church_name: str = Field(..., min_length=1, max_length=255)
+    theme: str = Field(..., min_length=1, max_length=255)
     llm_call_id: Optional[int] = None
 
 # Exception handlers
 @app.exception_handler(APIError)
 async def api_error_handler(request, exc: APIError):
     """Handle APIError exceptions"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             'success': False,
@@ -152,7 +407,7 @@ async def api_error_handler(request, exc: APIError):
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc: Exception):
     """Handle general exceptions"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             'success': False,
@@ -187,8 +442,8 @@ async def generate_coloring_image(request: Request, coloring_request: ColoringIm
     if not theme:
         raise APIError('Valid theme is required', 400)
     
-    # Generate image using AI service
-    image_url = ai_service.generate_coloring_image(prompt, theme)
+    # Generate image using AI service (in a thread - keeps the event loop free)
+    image_url = await asyncio.to_thread(ai_service.generate_coloring_image, prompt, theme)
     
     return {
         'success': True,
@@ -196,6 +451,44 @@ async def generate_coloring_image(request: Request, coloring_request: ColoringIm
     }
 
 
+async def save_preview_image(http, preview_url: str, file_path: str, file_name: str):
+    """
+    Decode or download a preview image and save it next to its PDF
+
+    Returns the relative preview path (same format as file_path), or None
+    if saving failed - preview problems never fail the upload itself.
+    """
+    try:
+        # Handle base64 data URIs (from Gemini) or regular URLs
+        if preview_url.startswith('data:'):
+            # Format: data:image/png;base64,<base64data>
+            # partition() avoids copying the header; one decode, no
+            # intermediate buffers
+            _, _, data = preview_url.partition(',')
+            image_data = base64.b64decode(data)
+        else:
+            # Download from URL using the shared session (warm connections)
+            async with http.get(preview_url) as response:
+                if response.status == 200:
+                    image_data = await response.read()
+                else:
+                    raise Exception(f"Failed to download image: HTTP {response.status}")
+
+        # Save image to same directory as PDF
+        # file_path is relative like "church-name/file.pdf"
+        preview_filename = f"preview-{file_name.replace('.pdf', '.png')}"
+        preview_path = pdf_storage_service.storage_path / file_path.replace(file_name, preview_filename)
+        # mkdir + write batched into one executor hop
+        await pdf_storage_service.write_file(preview_path, image_data, make_parents=True)
+        # Store relative path same format as file_path
+        preview_image_path = file_path.replace(file_name, preview_filename)
+        print(f"✅ Preview image saved: {preview_image_path}")
+        return preview_image_path
+    except Exception:
+        logger.exception("Failed to save preview image")
+        return None
+
+
 @app.post('/api/upload-pdf')
 @limiter.limit("20/minute")  # File uploads are moderate cost
 async def upload_pdf(
@@ -212,20 +505,16 @@ async def upload_pdf(
     if not validate_file_extension(filename):
         raise APIError('Only PDF files are allowed', 400)
     
-    # Read file content
-    file_content = await pdf.read()
-    
-    # Validate file size (max 10MB)
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    if len(file_content) > MAX_FILE_SIZE:
-        raise APIError('File size exceeds maximum allowed size (10MB)', 400)
+    # Read file content in chunks (size limit enforced incrementally)
+    file_content = await read_upload(pdf, MAX_FILE_SIZE)
+
     if len(file_content) == 0:
         raise APIError('File is empty', 400)
     
     # Parse metadata
     try:
-        metadata_dict = json.loads(metadata) if isinstance(metadata, str) else metadata
-    except json.JSONDecodeError:
+        metadata_dict = orjson.loads(metadata) if isinstance(metadata, str) else metadata
+    except orjson.JSONDecodeError:
         raise APIError('Invalid metadata JSON format', 400)
     
     # Validate and sanitize metadata fields
@@ -240,62 +529,25 @@ async def upload_pdf(
     metadata_dict['church_name'] = church_name
     metadata_dict['theme'] = theme
     
-    # Create a file-like object for pdf_storage_service
-    from io import BytesIO
-    pdf_file = BytesIO(file_content)
-    pdf_file.name = filename
-    
-    # Save PDF to local filesystem (async)
-    file_path, file_name = await pdf_storage_service.save_pdf(pdf_file, metadata_dict)
-    
+    # Save PDF to local filesystem (async) - save_pdf accepts raw bytes,
+    # so no intermediate BytesIO copy is needed
+    file_path, file_name = await pdf_storage_service.save_pdf(file_content, metadata_dict)
+
+    # Kick off the preview save immediately so its decode/download/write
+    # overlaps the file-size stat and the database insert below
+    preview_task = None
+    if metadata_dict.get('preview_image_url'):
+        preview_task = asyncio.create_task(
+            save_preview_image(request.app.state.http, metadata_dict.get('preview_image_url'),
+                               file_path, file_name)
+        )
+
     # Get file size (async)
     file_size = await pdf_storage_service.get_file_size(file_path)
-    
-    # Save preview image if provided (after PDF is saved so we know the directory)
-    preview_image_url = None
-    preview_image_path = None
-    if metadata_dict.get('preview_image_url'):
-        try:
-            import aiofiles
-            import base64
-            preview_url = metadata_dict.get('preview_image_url')
-            
-            # Handle base64 data URIs (from Gemini) or regular URLs
-            if preview_url.startswith('data:'):
-                # Extract base64 data from data URI
-                # Format: data:image/png;base64,<base64data>
-                header, data = preview_url.split(',', 1)
-                image_data = base64.b64decode(data)
-            else:
-                # Download from URL
-                import aiohttp
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(preview_url) as response:
-                        if response.status == 200:
-                            image_data = await response.read()
-                        else:
-                            raise Exception(f"Failed to download image: HTTP {response.status}")
-            
-            # Save image to same directory as PDF
-            # file_path is relative like "church-name/file.pdf"
-            preview_filename = f"preview-{file_name.replace('.pdf', '.png')}"
-            preview_path = pdf_storage_service.storage_path / file_path.replace(file_name, preview_filename)
-            await asyncio.to_thread(preview_path.parent.mkdir, parents=True, exist_ok=True)
-            async with aiofiles.open(preview_path, 'wb') as f:
-                await f.write(image_data)
-            # Store relative path same format as file_path
-            preview_image_path = file_path.replace(file_name, preview_filename)
-            print(f"✅ Preview image saved: {preview_image_path}")
-        except Exception as e:
-            print(f"⚠️  Failed to save preview image: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # Add preview image path to metadata
-    if preview_image_path:
-        metadata_dict['preview_image_path'] = preview_image_path
-    
+
     # Save to database (async) - always save, regardless of preview image
+    # The preview path is attached with a follow-up UPDATE once the
+    # preview task finishes, so the insert doesn't wait on image I/O
     pamphlet_id = None
     if database_service.is_enabled():
         try:
@@ -307,21 +559,24 @@ async def upload_pdf(
                 'file_size_bytes': file_size or 0,
                 'llm_call_id': metadata_dict.get('llm_call_id'),
                 'metadata': metadata_dict,
-                'preview_image_path': preview_image_path  # Store separately, not in JSON
+                'preview_image_path': None  # Filled in below once the preview is saved
             })
             if pamphlet_id:
                 print(f"✅ Pamphlet saved to database with ID: {pamphlet_id}")
-                # Update preview_image_url now that we have the pamphlet_id
-                if preview_image_path:
-                    preview_image_url = f'/api/pamphlets/{pamphlet_id}/preview'
+                _invalidate_list_cache()
             else:
                 print(f"⚠️  Failed to save pamphlet to database (pamphlet_id is None)")
-        except Exception as e:
-            print(f"❌ Error saving pamphlet to database: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error saving pamphlet to database")
     else:
         print("⚠️  Database not enabled, skipping database save")
+
+    preview_image_path = await preview_task if preview_task else None
+    if preview_image_path and pamphlet_id:
+        # Fire-and-forget: the client only needs pamphlet_id
+        _spawn_background_task(
+            database_service.update_preview_path(pamphlet_id, preview_image_path)
+        )
     
     return {
         'success': True,
@@ -347,8 +602,8 @@ async def generate_quiz(request: Request, quiz_request: QuizRequest):
     if not num_questions:
         raise APIError('num_questions must be between 1 and 50', 400)
     
-    # Generate questions using AI service
-    questions = ai_service.generate_quiz_questions(theme, num_questions)
+    # Generate questions using AI service (in a thread - keeps the event loop free)
+    questions = await asyncio.to_thread(ai_service.generate_quiz_questions, theme, num_questions)
     
     return {
         'success': True,
@@ -371,8 +626,8 @@ async def generate_crossword_words(request: Request, words_request: CrosswordWor
     if not num_words:
         raise APIError('num_words must be between 3 and 20', 400)
     
-    # Generate words using AI service
-    words = ai_service.generate_crossword_words(theme, num_words)
+    # Generate words using AI service (in a thread - keeps the event loop free)
+    words = await asyncio.to_thread(ai_service.generate_crossword_words, theme, num_words)
     
     return {
         'success': True,
@@ -392,8 +647,8 @@ async def generate_crossword(request: Request, theme_request: ThemeRequest):
     if not theme:
         raise APIError('Valid theme is required', 400)
     
-    # Generate complete crossword using AI service
-    puzzle = ai_service.generate_crossword(theme)
+    # Generate complete crossword using AI service (in a thread - keeps the event loop free)
+    puzzle = await asyncio.to_thread(ai_service.generate_crossword, theme)
     
     return {
         'success': True,
@@ -413,9 +668,9 @@ async def generate_pamphlet_content(request: Request, theme_request: ThemeReques
     if not theme:
         raise APIError('Valid theme is required', 400)
     
-    # Generate all content using AI service (sync method)
-    # For better performance, we could make this async in the future
-    content = ai_service.generate_pamphlet_content(theme)
+    # Generate all content using AI service (sync method, run in a thread
+    # so the multi-second LLM round-trip doesn't block the event loop)
+    content = await asyncio.to_thread(ai_service.generate_pamphlet_content, theme)
     
     return {
         'success': True,
@@ -441,6 +696,19 @@ async def get_config(request: Request):
 # PDF History API Endpoints
 # ============================================================================
 
+# Pre-serialized /api/pamphlets responses, keyed by the filter tuple.
+# The default listing (limit=20, newest first) dominates traffic and
+# changes rarely; a 5s TTL means warm hits skip the DB round-trip, row
+# formatting and JSON encoding. Cleared on upload/delete.
+_list_cache = {}
+_LIST_CACHE_TTL = 5  # seconds
+_LIST_CACHE_MAX = 256
+
+
+def _invalidate_list_cache():
+    _list_cache.clear()
+
+
 @app.get('/api/pamphlets')
 @limiter.limit("60/minute")  # Read-only endpoint, more lenient
 async def get_pamphlets(
@@ -449,8 +717,10 @@ async def get_pamphlets(
     theme: Optional[str] = Query(None, description="Filter by theme"),
     limit: int = Query(20, ge=1, le=100, description="Number of results"),
     offset: int = Query(0, ge=0, le=10000, description="Pagination offset"),
+    cursor: Optional[str] = Query(None, description="Keyset cursor '<created_at>,<id>' from a previous page (created_at desc only)"),
     sort: str = Query('created_at', description="Sort field"),
-    order: str = Query('desc', description="Sort order (asc/desc)")
+    order: str = Query('desc', description="Sort order (asc/desc)"),
+    include_total: bool = Query(True, description="Set false to skip the COUNT(*) and get total=-1 (infinite scroll)")
 ):
     """
     Get list of pamphlets with filters and pagination
@@ -478,25 +748,55 @@ async def get_pamphlets(
         'sort': sort,
         'order': order
     }
-    
+
     # Remove None values
     filters = {k: v for k, v in filters.items() if v is not None}
-    
+    if not include_total:
+        filters['include_total'] = False
+
+    # Keyset cursor: O(limit) pagination that skips the COUNT(*) scan
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = cursor.rsplit(',', 1)
+            filters['cursor_created_at'] = datetime.fromisoformat(cursor_created_at)
+            filters['cursor_id'] = int(cursor_id)
+        except ValueError:
+            raise APIError('Invalid cursor', 400)
+
+    # Serve a recent pre-serialized payload if we have one
+    cache_key = tuple(sorted(filters.items()))
+    cached = _list_cache.get(cache_key)
+    if cached is not None:
+        payload, expires = cached
+        if expires > time.monotonic():
+            return Response(payload, media_type='application/json')
+        del _list_cache[cache_key]
+
     try:
         pamphlets, total = await database_service.get_pamphlets(filters)
     except Exception as e:
-        print(f"❌ Error fetching pamphlets: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error fetching pamphlets")
         raise APIError(f'Failed to fetch pamphlets: {str(e)}', 500)
-    
-    return {
+
+    # Cursor for the next page when this one came back full
+    next_cursor = None
+    if pamphlets and len(pamphlets) >= limit and sort == 'created_at' and order == 'desc':
+        last = pamphlets[-1]
+        if last.get('created_at'):
+            next_cursor = f"{last['created_at']},{last['id']}"
+
+    payload = orjson.dumps({
         'success': True,
         'pamphlets': pamphlets,
         'total': total,
         'limit': filters.get('limit', 20),
-        'offset': filters.get('offset', 0)
-    }
+        'offset': filters.get('offset', 0),
+        'next_cursor': next_cursor
+    })
+    if len(_list_cache) >= _LIST_CACHE_MAX:
+        _list_cache.clear()
+    _list_cache[cache_key] = (payload, time.monotonic() + _LIST_CACHE_TTL)
+    return Response(payload, media_type='application/json')
 
 
 @app.get('/api/pamphlets/{pamphlet_id}')
@@ -523,32 +823,61 @@ async def get_pamphlet(
 @limiter.limit("60/minute")  # Read-only endpoint
 async def get_preview_image(
     request: Request,
-    pamphlet_id: int = PathParam(..., gt=0, description="Pamphlet ID")
+    pamphlet_id: int = PathParam(..., gt=0, description="Pamphlet ID"),
+    p: Optional[str] = Query(None, description="Signed file path"),
+    e: Optional[int] = Query(None, description="Signature expiry (unix time)"),
+    s: Optional[str] = Query(None, description="HMAC signature")
 ):
     """
     Get preview image for a pamphlet
     """
-    # Get pamphlet record
-    pamphlet = await database_service.get_pamphlet_by_id(pamphlet_id)
-    
-    if not pamphlet:
-        raise APIError('Pamphlet not found', 404)
-    
-    # Get preview image path from column (not from metadata JSON)
-    preview_path = pamphlet.get('preview_image_path')
-    
-    if not preview_path:
-        raise APIError('Preview image not found', 404)
-    
+    if SIGNED_URL_SECRET and p and e and s and verify_file_token(SIGNED_URL_SECRET, pamphlet_id, p, e, s):
+        # Signed URL: the file path is authenticated by the HMAC, so skip
+        # the database round-trip entirely
+        preview_path = p
+    else:
+        # Get pamphlet record
+        pamphlet = await database_service.get_pamphlet_by_id(pamphlet_id)
+
+        if not pamphlet:
+            raise APIError('Pamphlet not found', 404)
+
+        # Get preview image path from column (not from metadata JSON)
+        preview_path = pamphlet.get('preview_image_path')
+
+        if not preview_path:
+            raise APIError('Preview image not found', 404)
+
     # Get file path
     file_path = await pdf_storage_service.get_file_path(preview_path)
-    
-    if not file_path or not Path(file_path).exists():
+
+    if not file_path:
         raise APIError('Preview image file not found', 404)
-    
+
+    if USE_XACCEL:
+        if not await asyncio.to_thread(_file_exists_cached, file_path):
+            raise APIError('Preview image file not found', 404)
+        # Let nginx stream the file via sendfile()
+        return Response(
+            headers={
+                'X-Accel-Redirect': f'{XACCEL_PREFIX}/{preview_path}',
+                'Content-Type': 'image/png',
+                'Cache-Control': 'public, max-age=31536000'  # Cache for 1 year
+            }
+        )
+
+    # One stat doubles as the existence check and is reused by
+    # FileResponse for its headers, instead of an exists() + two
+    # internal os.stat calls
+    try:
+        stat_result = await asyncio.to_thread(os.stat, file_path)
+    except OSError:
+        raise APIError('Preview image file not found', 404)
+
     # Return image file
     return FileResponse(
         path=file_path,
+        stat_result=stat_result,
         media_type='image/png',
         headers={
             'Cache-Control': 'public, max-age=31536000'  # Cache for 1 year
@@ -560,30 +889,63 @@ async def get_preview_image(
 @limiter.limit("30/minute")  # File downloads, moderate limit
 async def download_pamphlet(
     request: Request,
-    pamphlet_id: int = PathParam(..., gt=0, description="Pamphlet ID")
+    pamphlet_id: int = PathParam(..., gt=0, description="Pamphlet ID"),
+    p: Optional[str] = Query(None, description="Signed file path"),
+    e: Optional[int] = Query(None, description="Signature expiry (unix time)"),
+    s: Optional[str] = Query(None, description="HMAC signature")
 ):
     """
     Download a PDF pamphlet file
     """
-    # Get pamphlet record
-    pamphlet = await database_service.get_pamphlet_by_id(pamphlet_id)
-    
-    if not pamphlet:
-        raise APIError('Pamphlet not found', 404)
-    
+    if SIGNED_URL_SECRET and p and e and s and verify_file_token(SIGNED_URL_SECRET, pamphlet_id, p, e, s):
+        # Signed URL: the file path is authenticated by the HMAC, so skip
+        # the database round-trip entirely
+        relative_path = p
+        file_name = p.rsplit('/', 1)[-1]
+    else:
+        # Get pamphlet record
+        pamphlet = await database_service.get_pamphlet_by_id(pamphlet_id)
+
+        if not pamphlet:
+            raise APIError('Pamphlet not found', 404)
+
+        relative_path = pamphlet['file_path']
+        file_name = pamphlet['file_name']
+
     # Get file path
-    file_path = await pdf_storage_service.get_file_path(pamphlet['file_path'])
-    
-    if not file_path or not Path(file_path).exists():
+    file_path = await pdf_storage_service.get_file_path(relative_path)
+
+    if not file_path:
         raise APIError('PDF file not found', 404)
-    
+
+    if USE_XACCEL:
+        if not await asyncio.to_thread(_file_exists_cached, file_path):
+            raise APIError('PDF file not found', 404)
+        # Let nginx stream the file via sendfile()
+        return Response(
+            headers={
+                'X-Accel-Redirect': f'{XACCEL_PREFIX}/{relative_path}',
+                'Content-Type': 'application/pdf',
+                'Content-Disposition': f'attachment; filename="{file_name}"'
+            }
+        )
+
+    # One stat doubles as the existence check and is reused by
+    # FileResponse for its headers, instead of an exists() + two
+    # internal os.stat calls
+    try:
+        stat_result = await asyncio.to_thread(os.stat, file_path)
+    except OSError:
+        raise APIError('PDF file not found', 404)
+
     # Return file using FastAPI's FileResponse
     return FileResponse(
         path=file_path,
-        filename=pamphlet['file_name'],
+        stat_result=stat_result,
+        filename=file_name,
         media_type='application/pdf',
         headers={
-            'Content-Disposition': f'attachment; filename="{pamphlet["file_name"]}"'
+            'Content-Disposition': f'attachment; filename="{file_name}"'
         }
     )
 
@@ -601,6 +963,8 @@ async def delete_pamphlet(
     
     if not success:
         raise APIError('Pamphlet not found', 404)
+
+    _invalidate_list_cache()
     
     return {
         'success': True,
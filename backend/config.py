@@ -0,0 +1,74 @@
+"""
+Application configuration
+
+Snapshot of the environment variables the long-lived services need,
+taken once after load_dotenv has run instead of re-reading os.environ
+in every constructor. Services accept an optional Config for tests;
+when none is passed they share the cached instance from get_config().
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Immutable snapshot of service configuration from the environment"""
+
+    # Database
+    mysql_host: str
+    mysql_port: int
+    mysql_user: Optional[str]
+    mysql_password: Optional[str]
+    mysql_database: str
+
+    # Signed download URLs
+    signed_url_secret: Optional[str]
+    signed_url_ttl: int
+
+    # PDF storage
+    pdf_storage_dir: str
+    pdf_storage_path: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> 'Config':
+        """Build a Config from the current environment"""
+        return cls(
+            mysql_host=os.getenv('MYSQL_HOST', 'localhost'),
+            mysql_port=int(os.getenv('MYSQL_PORT', 3306)),
+            mysql_user=os.getenv('MYSQL_USER'),
+            mysql_password=os.getenv('MYSQL_PASSWORD'),
+            mysql_database=os.getenv('MYSQL_DATABASE', 'kidschurch'),
+            signed_url_secret=os.getenv('SIGNED_URL_SECRET'),
+            signed_url_ttl=int(os.getenv('SIGNED_URL_TTL', 3600)),
+            pdf_storage_dir=os.getenv('PDF_STORAGE_DIR', 'pdfs'),
+            pdf_storage_path=os.getenv('PDF_STORAGE_PATH'),
+        )
+
+    def resolved_storage_path(self) -> Path:
+        """Storage directory as a Path, defaulting relative to backend/"""
+        if self.pdf_storage_path:
+            return Path(self.pdf_storage_path)
+        return Path(__file__).parent / self.pdf_storage_dir
+
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """
+    Shared Config instance
+
+    Built lazily on first use (after app.py has called load_dotenv) so
+    .env values are honored, then reused by every service.
+    """
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = Config.from_env()
+    return _config
@@ -7,7 +7,15 @@ import os
 
 # Server socket
 bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5001)}"
-backlog = 2048
+
+# SO_REUSEPORT (Linux 3.9+): each worker binds its own listen socket and
+# the kernel hashes incoming connections across them, instead of all
+# workers thundering-herd waking on one shared accept queue
+reuse_port = True
+
+# Per-listener backlog; with reuse_port every worker has its own queue,
+# so the old shared 2048 would otherwise multiply per worker
+backlog = 512
 
 # Worker processes
 # Use fewer workers for local dev, more for production
@@ -19,7 +27,48 @@ else:
 worker_class = 'uvicorn.workers.UvicornWorker'  # Required for FastAPI (ASGI)
 worker_connections = 1000
 timeout = 120
-keepalive = 5
+# Long keepalive lets browser clients reuse connections (pairs with the
+# cached CORS pre-flight responses)
+keepalive = 30
+
+# Import the app once in the master and share it copy-on-write across
+# workers instead of re-importing FastAPI/pydantic/AI SDKs per worker.
+# Safe here: connection pools and HTTP sessions are created in the
+# FastAPI lifespan, which runs after fork in each worker.
+preload_app = True
+
+# Note on the HTTP parser/event loop: uvicorn[standard] (see
+# requirements.txt) installs httptools and uvloop, which UvicornWorker
+# auto-selects over the pure-Python h11/asyncio implementations. Set
+# UVICORN_LOOP=uvloop in the environment to fail loudly if uvloop is
+# missing instead of silently falling back to asyncio.
+
+
+def post_fork(server, worker):
+    """Re-seed random state per worker (preload_app shares the parent's)"""
+    import random
+    random.seed()
+
+
+def post_worker_init(worker):
+    """Enable TCP keepalive on the worker's listen sockets
+
+    Accepted connections inherit these options on Linux, so half-open
+    clients (mobile networks, dropped NAT entries) are detected and
+    reaped after ~90s instead of holding worker connections until the
+    2h kernel default.
+    """
+    import socket
+    for listener in getattr(worker, 'sockets', []):
+        try:
+            sock = listener.sock
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except (OSError, AttributeError):
+            # Non-Linux platforms may lack TCP_KEEPIDLE/KEEPINTVL/KEEPCNT
+            pass
 
 # Request body size limit (for file uploads)
 # This allows up to 15MB uploads (PDFs can be large)
@@ -5,14 +5,90 @@ Creates the database schema for Church Games backend
 
 import sys
 import os
-import mysql.connector
-from mysql.connector import Error
+import pymysql
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-def create_database():
+def run_migrations(cursor, database):
+    """
+    Apply schema migrations for databases created before the current DDL
+
+    Only needed for legacy databases: fresh installs get the full schema
+    from CREATE TABLE. Run with: python init_database.py --migrate
+    """
+    # Add preview_image_path column if it doesn't exist
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) as col_count
+            FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE TABLE_SCHEMA = %s 
+            AND TABLE_NAME = 'pamphlets' 
+            AND COLUMN_NAME = 'preview_image_path'
+        """, (database,))
+        col_exists = cursor.fetchone()[0] > 0
+        
+        if not col_exists:
+            cursor.execute("""
+                ALTER TABLE pamphlets 
+                ADD COLUMN preview_image_path VARCHAR(500) NULL 
+                AFTER metadata
+            """)
+            print("✅ Column 'preview_image_path' added")
+        else:
+            print("✅ Column 'preview_image_path' already exists")
+    except Exception as e:
+        print(f"⚠️  Could not add preview_image_path column: {e}")
+
+    # Add the composite list index if it doesn't exist (serves the
+    # active-pamphlets list scan and keyset pagination)
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) as idx_count
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'pamphlets'
+            AND INDEX_NAME = 'idx_active_created'
+        """, (database,))
+        idx_exists = cursor.fetchone()[0] > 0
+
+        if not idx_exists:
+            cursor.execute("""
+                ALTER TABLE pamphlets
+                ADD INDEX idx_active_created (deleted_at, created_at, id)
+            """)
+            print("✅ Index 'idx_active_created' added")
+        else:
+            print("✅ Index 'idx_active_created' already exists")
+    except Exception as e:
+        print(f"⚠️  Could not add idx_active_created index: {e}")
+
+    # Add the usage-stats index if it doesn't exist (keeps the grouped
+    # rollup scan bounded when date filters are set)
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) as idx_count
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = %s
+            AND TABLE_NAME = 'llm_api_calls'
+            AND INDEX_NAME = 'idx_ts_provider_endpoint'
+        """, (database,))
+        idx_exists = cursor.fetchone()[0] > 0
+
+        if not idx_exists:
+            cursor.execute("""
+                ALTER TABLE llm_api_calls
+                ADD INDEX idx_ts_provider_endpoint (timestamp, provider, endpoint)
+            """)
+            print("✅ Index 'idx_ts_provider_endpoint' added")
+        else:
+            print("✅ Index 'idx_ts_provider_endpoint' already exists")
+    except Exception as e:
+        print(f"⚠️  Could not add idx_ts_provider_endpoint index: {e}")
+
+
+def create_database(migrate=False):
     """Create the database if it doesn't exist"""
     try:
         host = os.getenv('MYSQL_HOST', 'localhost')
@@ -28,11 +104,12 @@ def create_database():
         
         # Connect without database first
         print(f"🔌 Connecting to MySQL at {host}:{port}...")
-        conn = mysql.connector.connect(
+        conn = pymysql.connect(
             host=host,
             port=port,
             user=user,
-            password=password
+            password=password,
+            charset='utf8mb4'
         )
         
         cursor = conn.cursor()
@@ -67,7 +144,8 @@ def create_database():
                 request_id VARCHAR(100),
                 INDEX idx_timestamp (timestamp),
                 INDEX idx_provider (provider),
-                INDEX idx_request_id (request_id)
+                INDEX idx_request_id (request_id),
+                INDEX idx_ts_provider_endpoint (timestamp, provider, endpoint)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         """)
         print("✅ Table 'llm_api_calls' created")
@@ -90,34 +168,18 @@ def create_database():
                 INDEX idx_created_at (created_at),
                 INDEX idx_church_name (church_name),
                 INDEX idx_theme (theme),
-                INDEX idx_deleted_at (deleted_at)
+                INDEX idx_deleted_at (deleted_at),
+                INDEX idx_active_created (deleted_at, created_at, id)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         """)
         print("✅ Table 'pamphlets' created")
         
-        # Add preview_image_path column if it doesn't exist (for existing databases)
-        try:
-            # Check if column exists first
-            cursor.execute("""
-                SELECT COUNT(*) as col_count
-                FROM INFORMATION_SCHEMA.COLUMNS 
-                WHERE TABLE_SCHEMA = %s 
-                AND TABLE_NAME = 'pamphlets' 
-                AND COLUMN_NAME = 'preview_image_path'
-            """, (database,))
-            col_exists = cursor.fetchone()[0] > 0
-            
-            if not col_exists:
-                cursor.execute("""
-                    ALTER TABLE pamphlets 
-                    ADD COLUMN preview_image_path VARCHAR(500) NULL 
-                    AFTER metadata
-                """)
-                print("✅ Column 'preview_image_path' added")
-            else:
-                print("✅ Column 'preview_image_path' already exists")
-        except Exception as e:
-            print(f"⚠️  Could not add preview_image_path column: {e}")
+        # Schema migrations for pre-existing databases are opt-in: the
+        # CREATE TABLE above already carries the full current schema, so
+        # cold starts skip the INFORMATION_SCHEMA probe + DDL lock check
+        if migrate:
+            print("🔧 Running schema migrations...")
+            run_migrations(cursor, database)
         
         conn.commit()
         cursor.close()
@@ -128,7 +190,7 @@ def create_database():
         print(f"📁 Tables: llm_api_calls, pamphlets")
         return True
         
-    except Error as e:
+    except pymysql.MySQLError as e:
         print(f"❌ MySQL Error: {e}")
         return False
     except Exception as e:
@@ -140,7 +202,7 @@ if __name__ == '__main__':
     print("🚀 Church Games Database Initialization")
     print("=" * 50)
     
-    success = create_database()
+    success = create_database(migrate='--migrate' in sys.argv)
     
     if success:
         print("\n✅ Setup complete! You can now start the backend server.")
@@ -4,34 +4,227 @@ Anthropic Claude implementation
 
 import os
 import json
-import re
-from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, build_quiz_user_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt
+import logging
+import orjson
+import time
+import random
+import atexit
+import concurrent.futures
+from typing import Optional
+from pydantic import ValidationError
+from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, PamphletContent, build_quiz_user_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt, build_combined_prompt, build_combined_prompt_blocks, COLORING_PROMPT_FIELDS, COLORING_PROMPT_FIELD_RES
 from utils.tracking import track_llm_call
+from .cache import disk_cached
+from .ratelimit import get_limiter
+
+# logger.warning defers formatting/I-O to the logging handlers (queued
+# in app bootstrap), unlike print which can block on a full stdout pipe
+logger = logging.getLogger(__name__)
+
+# Shared worker pool for image generation. A per-request
+# ThreadPoolExecutor spawns and joins two threads per pamphlet; a
+# module-level pool avoids that churn and bounds total image threads.
+_IMAGE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="anthropic-img"
+)
+atexit.register(_IMAGE_EXECUTOR.shutdown, wait=False)
+
+# One Anthropic client per API key, shared by every AnthropicService
+# instance. Keeping the underlying httpx connection pool alive across
+# quiz/crossword/pamphlet calls avoids a fresh TCP+TLS handshake to
+# api.anthropic.com per call
+_CLIENT_CACHE = {}
+
+# Lazily-built OpenAI image service shared by all AnthropicService
+# instances (Anthropic has no image generation). Built on first use so
+# .env is loaded by then, and reused so the OpenAI client and its httpx
+# pool aren't recreated per pamphlet request.
+_default_image_service_instance = None
+
+
+def _default_image_service():
+    """Return the shared OpenAI image service, creating it on first use"""
+    global _default_image_service_instance
+    if _default_image_service_instance is None:
+        from .openai_service import OpenAIService
+        _default_image_service_instance = OpenAIService()
+    return _default_image_service_instance
+
+
+# Client-side resilience for messages.create: transient 429/5xx are
+# retried with exponential backoff, and a small circuit breaker fails
+# fast for _BREAKER_RESET seconds after _BREAKER_FAIL_MAX consecutive
+# failures so a provider outage doesn't add retry-seconds to every call
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_BREAKER_FAIL_MAX = 5
+_BREAKER_RESET = 30
+_breaker_failures = 0
+_breaker_opened_at = 0.0
+
+
+def _estimate_tokens(create_kwargs: dict) -> int:
+    """Rough request token estimate: prompt chars/4 plus the output budget"""
+    chars = 0
+    system = create_kwargs.get('system') or ''
+    if isinstance(system, str):
+        chars += len(system)
+    else:
+        chars += sum(len(block.get('text', '')) for block in system)
+    for message in create_kwargs.get('messages', ()):
+        content = message.get('content') or ''
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(block.get('text', '')) for block in content)
+    return chars // 4 + create_kwargs.get('max_tokens', 0)
+
+
+def _call_with_retry(client, retries: int = 3, base: float = 0.5, **create_kwargs):
+    """Call messages.create with backoff on transient errors and a circuit breaker"""
+    global _breaker_failures, _breaker_opened_at
+
+    if _breaker_failures >= _BREAKER_FAIL_MAX:
+        if time.monotonic() - _breaker_opened_at < _BREAKER_RESET:
+            raise Exception("Anthropic circuit breaker open (recent consecutive failures); failing fast")
+        # Half-open: let one probe call through
+        _breaker_failures = 0
+
+    from anthropic import APIStatusError
+
+    # Client-side backpressure: wait for RPM/TPM budget instead of
+    # burning a round trip into a guaranteed 429
+    limiter = get_limiter('anthropic')
+
+    attempt = 0
+    while True:
+        limiter.acquire(_estimate_tokens(create_kwargs))
+        try:
+            response = client.messages.create(**create_kwargs)
+            _breaker_failures = 0
+            return response
+        except APIStatusError as e:
+            status = getattr(e, 'status_code', None)
+            if status == 429:
+                # Honor the provider's Retry-After for all callers
+                try:
+                    retry_after = float(e.response.headers.get('retry-after', 0))
+                except (TypeError, ValueError, AttributeError):
+                    retry_after = 0
+                if retry_after > 0:
+                    limiter.pause(retry_after)
+            if status not in _RETRYABLE_STATUS or attempt >= retries:
+                _breaker_failures += 1
+                _breaker_opened_at = time.monotonic()
+                raise
+            # Exponential backoff with a little jitter to de-sync workers
+            time.sleep(base * (2 ** attempt) + random.uniform(0, 0.1))
+            attempt += 1
+        except Exception:
+            _breaker_failures += 1
+            _breaker_opened_at = time.monotonic()
+            raise
+
+
+# Env config snapshot, built on first AnthropicService() rather than at
+# module import: app.py imports service modules before load_dotenv runs,
+# so a module-level os.getenv would miss every .env value. Caching the
+# first read still amortizes the seven getenv calls across repeated
+# instantiations.
+_CONFIG = None
+
+
+def _get_config() -> dict:
+    global _CONFIG
+    if _CONFIG is None:
+        model = os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307')
+        _CONFIG = {
+            'api_key': os.getenv('ANTHROPIC_API_KEY'),
+            'model': model,
+            # Anthropic prompt caching: cached system/instruction prefixes
+            # return at ~10% of the input cost within the 5-minute window.
+            # Off by default; the pinned anthropic==0.24.0 predates the
+            # cache_control field, so enable only on a newer SDK.
+            'prompt_caching': os.getenv('ANTHROPIC_PROMPT_CACHING', '0') == '1',
+            # Per-endpoint model overrides. The pamphlet call is a
+            # mechanical JSON fill-in that Haiku handles at a fraction of
+            # Sonnet's cost and latency, so it can stay on Haiku even when
+            # ANTHROPIC_MODEL points at a larger model (and vice versa for
+            # quiz quality).
+            'quiz_model': os.getenv('ANTHROPIC_QUIZ_MODEL', model),
+            'crossword_model': os.getenv('ANTHROPIC_CROSSWORD_MODEL', model),
+            'pamphlet_model': os.getenv('ANTHROPIC_PAMPHLET_MODEL', model),
+        }
+    return _CONFIG
+
+
+def _get_client(api_key: str):
+    """Return a cached Anthropic client for this API key, creating it on first use"""
+    client = _CLIENT_CACHE.get(api_key)
+    if client is None:
+        import httpx
+        from anthropic import Anthropic
+        client = Anthropic(
+            api_key=api_key,
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+            )
+        )
+        _CLIENT_CACHE[api_key] = client
+    return client
 
 
 class AnthropicService(AIServiceBase):
     """Anthropic Claude implementation"""
-    
-    def __init__(self):
-        self.provider_name = "Anthropic Claude"
-        self.api_key = os.getenv('ANTHROPIC_API_KEY')
-        self.model = os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307')
+
+    provider_name = "Anthropic Claude"
+
+    def __init__(self, image_service: Optional[AIServiceBase] = None):
+        # Injected image service (tests, alternative providers); falls
+        # back to the shared OpenAI singleton when not supplied
+        self._image_service = image_service
+        config = _get_config()
+        self.api_key = config['api_key']
+        self.model = config['model']
+        self._prompt_caching = config['prompt_caching']
+        self._quiz_model = config['quiz_model']
+        self._crossword_model = config['crossword_model']
+        self._pamphlet_model = config['pamphlet_model']
         self._client = None
         
         if self.api_key:
             try:
-                from anthropic import Anthropic
-                self._client = Anthropic(api_key=self.api_key)
+                self._client = _get_client(self.api_key)
             except ImportError:
-                print("⚠️  Anthropic package not installed. Run: pip install anthropic")
+                logger.warning("Anthropic package not installed. Run: pip install anthropic")
     
     def is_enabled(self) -> bool:
         return self._client is not None and self.api_key is not None
-    
+
+    def _system_param(self, config: dict):
+        """System prompt, as an ephemeral cache_control block when prompt caching is on"""
+        if self._prompt_caching:
+            return [{
+                "type": "text",
+                "text": config['system_prompt'],
+                "cache_control": {"type": "ephemeral"}
+            }]
+        return config['system_prompt']
+
+    def _combined_user_content(self, theme: str, num_questions: int = 5, num_words: int = 8):
+        """Combined prompt with the fixed instruction block marked cacheable when enabled"""
+        if self._prompt_caching:
+            instructions, theme_text = build_combined_prompt_blocks(theme, num_questions, num_words)
+            return [
+                {"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": theme_text}
+            ]
+        return build_combined_prompt(theme, num_questions, num_words)
+
     def generate_coloring_image(self, prompt: str, theme: str) -> str:
         """Not implemented - Anthropic doesn't do image generation"""
         raise NotImplementedError("Image generation not available with Anthropic. Use OpenAI or Stable Diffusion.")
     
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_quiz_questions')
     def generate_quiz_questions(self, theme: str, num_questions: int = 10) -> list:
         """Generate quiz questions using Anthropic Claude"""
@@ -39,10 +232,11 @@ class AnthropicService(AIServiceBase):
             raise Exception("Anthropic service is not properly configured")
         
         try:
-            response = self._client.messages.create(
-                model=self.model,
+            response = _call_with_retry(
+                self._client,
+                model=self._quiz_model,
                 max_tokens=QUIZ_GENERATION_CONFIG['max_tokens'],
-                system=QUIZ_GENERATION_CONFIG['system_prompt'],
+                system=self._system_param(QUIZ_GENERATION_CONFIG),
                 messages=[
                     {"role": "user", "content": build_quiz_user_prompt(theme, num_questions)}
                 ]
@@ -54,6 +248,7 @@ class AnthropicService(AIServiceBase):
         except Exception as e:
             raise Exception(f"Failed to generate questions with Anthropic: {str(e)}")
     
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_crossword_words')
     def generate_crossword_words(self, theme: str, num_words: int = 8) -> list:
         """Generate crossword words using Anthropic Claude"""
@@ -61,10 +256,11 @@ class AnthropicService(AIServiceBase):
             raise Exception("Anthropic service is not properly configured")
         
         try:
-            response = self._client.messages.create(
-                model=self.model,
+            response = _call_with_retry(
+                self._client,
+                model=self._crossword_model,
                 max_tokens=CROSSWORD_CONFIG['max_tokens'],
-                system=CROSSWORD_CONFIG['system_prompt'],
+                system=self._system_param(CROSSWORD_CONFIG),
                 messages=[
                     {"role": "user", "content": build_crossword_words_prompt(theme, num_words)}
                 ]
@@ -72,87 +268,257 @@ class AnthropicService(AIServiceBase):
             
             text = response.content[0].text
             return self._parse_crossword_words_response(text, num_words)
-            
+
         except Exception as e:
             raise Exception(f"Failed to generate crossword words with Anthropic: {str(e)}")
-    
+
+    @disk_cached(ttl=86400)
+    @track_llm_call('generate_all')
+    def generate_all(self, theme: str, num_questions: int = 5, num_words: int = 8) -> dict:
+        """Generate quiz, word list and pamphlet text in a single Claude call (no images)"""
+        if not self.is_enabled():
+            raise Exception("Anthropic service is not properly configured")
+
+        try:
+            response = _call_with_retry(
+                self._client,
+                model=self._pamphlet_model,
+                max_tokens=PAMPHLET_CONTENT_CONFIG['max_tokens'],
+                system=self._system_param(PAMPHLET_CONTENT_CONFIG),
+                messages=[
+                    {"role": "user", "content": self._combined_user_content(theme, num_questions, num_words)},
+                    # Prefill: Claude continues straight into the JSON and
+                    # the stop sequence halts decoding at the closing fence
+                    {"role": "assistant", "content": "```json"}
+                ],
+                stop_sequences=["```"]
+            )
+
+            # The prefill + stop sequence constrain the response to bare
+            # JSON, so no fence-stripping pass is needed before parsing
+            return orjson.loads(response.content[0].text)
+
+        except orjson.JSONDecodeError as e:
+            raise Exception(f"Failed to parse combined content JSON from Anthropic: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Failed to generate combined content with Anthropic: {str(e)}")
+
+    def generate_pamphlet_content_batch(self, themes: list) -> dict:
+        """
+        Generate pamphlet text for many themes via the Message Batches API
+
+        Batched requests are priced ~50% below sync calls and skip the
+        per-request HTTP overhead, which matters for backfill jobs (e.g.
+        a year of Sunday-school themes). No coloring images are
+        generated; callers handle that per theme afterwards.
+
+        Falls back to sequential sync calls for a single theme or when
+        the installed anthropic SDK predates the Batches API.
+
+        Args:
+            themes: List of biblical themes
+
+        Returns:
+            Dict mapping theme -> parsed content dict (failed themes are omitted)
+        """
+        if not self.is_enabled():
+            raise Exception("Anthropic service is not properly configured")
+
+        if len(themes) == 1 or not hasattr(self._client.messages, 'batches'):
+            return {theme: self.generate_all(theme) for theme in themes}
+
+        # custom_id has a restricted charset, so index ids carry the mapping
+        id_to_theme = {f'theme-{i}': theme for i, theme in enumerate(themes)}
+        batch = self._client.messages.batches.create(
+            requests=[
+                {
+                    'custom_id': custom_id,
+                    'params': {
+                        'model': self._pamphlet_model,
+                        'max_tokens': PAMPHLET_CONTENT_CONFIG['max_tokens'],
+                        'system': PAMPHLET_CONTENT_CONFIG['system_prompt'],
+                        'messages': [
+                            {"role": "user", "content": build_pamphlet_content_prompt(theme)},
+                            {"role": "assistant", "content": "```json"}
+                        ],
+                        'stop_sequences': ["```"]
+                    }
+                }
+                for custom_id, theme in id_to_theme.items()
+            ]
+        )
+
+        while batch.processing_status != 'ended':
+            time.sleep(5)
+            batch = self._client.messages.batches.retrieve(batch.id)
+
+        results = {}
+        for entry in self._client.messages.batches.results(batch.id):
+            theme = id_to_theme.get(entry.custom_id)
+            if theme is None:
+                continue
+            if entry.result.type != 'succeeded':
+                logger.warning("Batch request for '%s' did not succeed: %s", theme, entry.result.type)
+                continue
+            try:
+                results[theme] = orjson.loads(entry.result.message.content[0].text)
+            except Exception as e:
+                logger.warning("Failed to parse batch result for '%s': %s", theme, e)
+
+        return results
+
+    # Short TTL: the pamphlet dict embeds DALL-E URLs (images come from
+    # the OpenAI image service), which expire ~1h after generation
+    @disk_cached(ttl=3600)
     @track_llm_call('generate_pamphlet_content')
     def generate_pamphlet_content(self, theme: str) -> dict:
-        """Generate all pamphlet content in one LLM call, then generate coloring images"""
+        """
+        Generate all pamphlet content in one LLM call, then generate coloring images
+
+        The Claude response is streamed: as soon as a coloring prompt
+        field closes in the partial JSON, its DALL-E call is submitted,
+        so image generation overlaps the remaining seconds of text
+        generation instead of starting after the full response.
+        """
         if not self.is_enabled():
             raise Exception("Anthropic service is not properly configured")
-        
+
+        # Use OpenAI for image generation (Anthropic doesn't support it)
+        try:
+            image_service = self._image_service or _default_image_service()
+        except Exception:
+            image_service = None
+        image_enabled = image_service is not None and image_service.is_enabled()
+
+        futures = {}    # dest key -> Future
+        submitted = {}  # prompt text -> Future (dedup identical prompts)
+        image_error = None
+
         try:
-            response = self._client.messages.create(
-                model=self.model,
+            buffer = ''
+            with self._client.messages.stream(
+                model=self._pamphlet_model,
                 max_tokens=PAMPHLET_CONTENT_CONFIG['max_tokens'],
-                system=PAMPHLET_CONTENT_CONFIG['system_prompt'],
+                system=self._system_param(PAMPHLET_CONTENT_CONFIG),
                 messages=[
-                    {"role": "user", "content": build_pamphlet_content_prompt(theme)}
-                ]
-            )
-            
-            text = response.content[0].text
-            
-            # Extract JSON from markdown code blocks if present
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    text = json_match.group(0)
-            
-            content = json.loads(text)
-            
-            # Generate coloring images if prompts are available
+                    {"role": "user", "content": self._combined_user_content(theme)},
+                    # Prefill: Claude continues straight into the JSON and
+                    # the stop sequence halts decoding at the closing fence
+                    {"role": "assistant", "content": "```json"}
+                ],
+                stop_sequences=["```"]
+            ) as stream:
+                for text_chunk in stream.text_stream:
+                    buffer += text_chunk
+                    if not image_enabled:
+                        continue
+                    # Dispatch each image as soon as its prompt field is
+                    # fully emitted in the partial JSON
+                    for field, dest in COLORING_PROMPT_FIELDS:
+                        if dest in futures:
+                            continue
+                        match = COLORING_PROMPT_FIELD_RES[field].search(buffer)
+                        if match:
+                            # Re-parse the raw JSON string value to unescape it
+                            prompt = orjson.loads(f'"{match.group(1)}"')
+                            try:
+                                # Identical text/scene prompts share one API call
+                                if prompt not in submitted:
+                                    submitted[prompt] = _IMAGE_EXECUTOR.submit(
+                                        image_service.generate_coloring_image, prompt, theme
+                                    )
+                                futures[dest] = submitted[prompt]
+                            except Exception as e:
+                                image_error = f"Failed to generate coloring images: {str(e)}"
+
+            # Validate the shape with pydantic-core before any image
+            # result is awaited, so malformed output fails fast here
+            # instead of deep in the image threads
+            try:
+                content = PamphletContent.model_validate_json(
+                    buffer
+                ).model_dump(exclude_none=True)
+            except ValidationError as validation_error:
+                # One corrective retry: show the model its response and
+                # ask for the exact schema before giving up
+                response = _call_with_retry(
+                    self._client,
+                    model=self._pamphlet_model,
+                    max_tokens=PAMPHLET_CONTENT_CONFIG['max_tokens'],
+                    system=self._system_param(PAMPHLET_CONTENT_CONFIG),
+                    messages=[
+                        {"role": "user", "content": self._combined_user_content(theme)},
+                        {"role": "assistant", "content": buffer.strip() or "{}"},
+                        {"role": "user", "content": (
+                            "That response did not match the required JSON schema "
+                            f"({validation_error.error_count()} validation errors). "
+                            "Return ONLY the exact JSON object requested, with every field present."
+                        )},
+                        {"role": "assistant", "content": "```json"}
+                    ],
+                    stop_sequences=["```"]
+                )
+                content = PamphletContent.model_validate_json(
+                    response.content[0].text
+                ).model_dump(exclude_none=True)
+
+            # Collect coloring images if prompts were available
             if 'coloringTextPrompt' in content and 'coloringScenePrompt' in content:
-                try:
-                    # Use OpenAI for image generation (Anthropic doesn't support it)
-                    from .openai_service import OpenAIService
-                    image_service = OpenAIService()
-                    
-                    if image_service.is_enabled():
-                        # Generate both images in parallel using threading
-                        import concurrent.futures
-                        
-                        def generate_text_image():
-                            return image_service.generate_coloring_image(
-                                content['coloringTextPrompt'], theme
-                            )
-                        
-                        def generate_scene_image():
-                            return image_service.generate_coloring_image(
-                                content['coloringScenePrompt'], theme
-                            )
-                        
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                            text_future = executor.submit(generate_text_image)
-                            scene_future = executor.submit(generate_scene_image)
-                            
-                            content['coloringTextImageUrl'] = text_future.result()
-                            content['coloringSceneImageUrl'] = scene_future.result()
-                    else:
-                        error_msg = "Anthropic does not support image generation. Configure AI_PROVIDER=openai with OPENAI_API_KEY in backend/.env file for image generation."
-                        print(f"⚠️  {error_msg}")
-                        content['coloringTextImageUrl'] = None
-                        content['coloringSceneImageUrl'] = None
+                if image_enabled:
+                    errors = []
+
+                    # Safety net: submit any prompt the streaming scan missed
+                    # (e.g. unusual escaping in the partial JSON). All
+                    # submits happen before the first result is awaited,
+                    # so the calls always run in parallel.
+                    for field, dest in COLORING_PROMPT_FIELDS:
+                        if dest not in futures:
+                            try:
+                                prompt = content[field]
+                                if prompt not in submitted:
+                                    submitted[prompt] = _IMAGE_EXECUTOR.submit(
+                                        image_service.generate_coloring_image, prompt, theme
+                                    )
+                                futures[dest] = submitted[prompt]
+                            except Exception as e:
+                                content[dest] = None
+                                errors.append(str(e))
+
+                    # Collect in completion order; one failed image never
+                    # cancels or hides its sibling. Deduped prompts share
+                    # a future, so group the dest keys per future first.
+                    dests_by_future = {}
+                    for dest, fut in futures.items():
+                        dests_by_future.setdefault(fut, []).append(dest)
+                    for fut in concurrent.futures.as_completed(dests_by_future):
+                        try:
+                            result = fut.result()
+                        except Exception as e:
+                            result = None
+                            errors.append(str(e))
+                        for dest in dests_by_future[fut]:
+                            content[dest] = result
+
+                    if errors:
+                        error_msg = f"Failed to generate coloring images: {'; '.join(errors)}"
+                        logger.error(error_msg)
                         content['coloringImageError'] = error_msg
-                        
-                except Exception as e:
-                    error_msg = f"Failed to generate coloring images: {str(e)}"
-                    print(f"⚠️  {error_msg}")
+                else:
+                    error_msg = image_error or (
+                        "Anthropic does not support image generation. Configure AI_PROVIDER=openai "
+                        "with OPENAI_API_KEY in backend/.env file for image generation."
+                    )
+                    logger.warning(error_msg)
                     content['coloringTextImageUrl'] = None
                     content['coloringSceneImageUrl'] = None
                     content['coloringImageError'] = error_msg
             else:
                 content['coloringTextImageUrl'] = None
                 content['coloringSceneImageUrl'] = None
-            
+
             return content
-            
-        except json.JSONDecodeError as e:
+
+        except orjson.JSONDecodeError as e:
             raise Exception(f"Failed to parse pamphlet content JSON from Anthropic: {str(e)}")
         except Exception as e:
             raise Exception(f"Failed to generate pamphlet content with Anthropic: {str(e)}")
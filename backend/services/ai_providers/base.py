@@ -2,8 +2,19 @@
 Base AI service interface and shared utilities
 """
 
+import functools
+import re
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+# Compiled once at import for the crossword fallback parser
+_UPPER_WORD_RE = re.compile(r'\b[A-Z]{3,10}\b')
+
+# Bump whenever prompts or the JSON schema change, so cached LLM
+# responses keyed on it (see cache.py) are invalidated
+PROMPT_VERSION = 2
 
 # Centralized prompts and configuration
 QUIZ_GENERATION_CONFIG = {
@@ -14,7 +25,9 @@ QUIZ_GENERATION_CONFIG = {
     ),
     'format_instruction': 'Format each question exactly as: Question here?\nAnswer in ALL CAPS\n\n',
     'temperature': 0.8,
-    'max_tokens': 500
+    # Latency scales with output tokens; 300 comfortably covers 10 short
+    # Q&A pairs
+    'max_tokens': 300
 }
 
 COLORING_IMAGE_CONFIG = {
@@ -35,7 +48,8 @@ CROSSWORD_CONFIG = {
     ),
     'format_instruction': 'Return ONLY the words as a comma-separated list in ALL CAPS. No numbers, no explanations, no extra text. Just the words separated by commas.',
     'temperature': 0.7,
-    'max_tokens': 300
+    # A comma-separated list of 8 short words needs far less than 100
+    'max_tokens': 100
 }
 
 PAMPHLET_CONTENT_CONFIG = {
@@ -45,41 +59,135 @@ PAMPHLET_CONTENT_CONFIG = {
         "All content must be biblical, kid-friendly, and match the theme provided."
     ),
     'temperature': 0.7,
-    'max_tokens': 2000
+    # The fixed JSON schema runs ~600 output tokens; 900 leaves headroom
+    # without letting slow decodes run to 2000
+    'max_tokens': 900
 }
 
 
+# Prompt templates assembled once at import; the builders only fill in
+# the varying tokens, so the fixed text is never re-concatenated and
+# stays byte-identical across calls (which prefix caching relies on)
+_QUIZ_PROMPT_TEMPLATE = (
+    "Generate {num_questions} fun quiz questions for 5-year-olds about the biblical theme '{theme}'. "
+    + QUIZ_GENERATION_CONFIG['format_instruction']
+    + "Keep questions very simple, age-appropriate, and fun. Focus on basic facts and characters from the {theme} story."
+)
+
+_COLORING_PROMPT_TEMPLATE = (
+    "Simple, cute, biblical {theme} cartoon character "
+    "for kids to color. " + COLORING_IMAGE_CONFIG['system_description'] + " "
+    "Focus on: {prompt}"
+)
+
+_CROSSWORD_PROMPT_TEMPLATE = (
+    "Generate EXACTLY {num_words} simple words for a crossword puzzle about the biblical theme '{theme}'. "
+    + CROSSWORD_CONFIG['format_instruction'] + " "
+    "Focus on key characters, objects, and concepts from the {theme} story. "
+    "Make sure to return exactly {num_words} words."
+)
+
+_QUIZ_BATCH_PROMPT_TEMPLATE = (
+    "Generate {num_questions} fun quiz questions for 5-year-olds about EACH of the "
+    "following biblical themes: {themes}.\n"
+    "Keep questions very simple, age-appropriate, and fun, with short answers in ALL CAPS.\n"
+    'Return ONLY a JSON object mapping each theme name EXACTLY as given above to its '
+    'list of questions, in this format:\n'
+    '{{"Theme Name": [{{"q": "Question here?", "a": "ANSWER IN CAPS"}}]}}'
+)
+
+
+# Markdown fence around a JSON object, compiled once at import
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+
+
+def extract_json_block(text: str) -> str:
+    """
+    Extract the first JSON object from model output
+
+    Tries a ```json fence first, then falls back to a single linear scan
+    for the first balanced {...} (tracking strings and escapes), which
+    avoids the O(n^2) backtracking a greedy DOTALL regex can hit on
+    multi-KB pamphlet responses.
+    """
+    match = _JSON_FENCE_RE.search(text)
+    if match:
+        return match.group(1)
+
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch == '"':
+            in_string = not in_string
+        elif not in_string:
+            if ch == '{':
+                if depth == 0:
+                    start = i
+                depth += 1
+            elif ch == '}' and depth:
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+    return text
+
+
+# Coloring prompt fields and the content keys their image URLs land in.
+# The regexes match a completed JSON string value in a partial response,
+# so image calls can start while the model is still streaming.
+COLORING_PROMPT_FIELDS = (
+    ('coloringTextPrompt', 'coloringTextImageUrl'),
+    ('coloringScenePrompt', 'coloringSceneImageUrl'),
+)
+COLORING_PROMPT_FIELD_RES = {
+    field: re.compile(rf'"{field}"\s*:\s*"((?:[^"\\]|\\.)*)"')
+    for field, _ in COLORING_PROMPT_FIELDS
+}
+
+
+# The theme catalog is small and the builders are pure, so each prompt
+# string is built once per process and reused on every later call
+@functools.lru_cache(maxsize=512)
 def build_quiz_user_prompt(theme: str, num_questions: int) -> str:
     """Build the user prompt for quiz generation"""
-    return (
-        f"Generate {num_questions} fun quiz questions for 5-year-olds about the biblical theme '{theme}'. "
-        f"{QUIZ_GENERATION_CONFIG['format_instruction']}"
-        f"Keep questions very simple, age-appropriate, and fun. Focus on basic facts and characters from the {theme} story."
-    )
+    return _QUIZ_PROMPT_TEMPLATE.format(theme=theme, num_questions=num_questions)
 
 
+@functools.lru_cache(maxsize=512)
 def build_coloring_prompt(prompt: str, theme: str) -> str:
     """Build the prompt for coloring image generation"""
-    return (
-        f"Simple, cute, biblical {theme.lower()} cartoon character "
-        f"for kids to color. {COLORING_IMAGE_CONFIG['system_description']} "
-        f"Focus on: {prompt}"
-    )
+    return _COLORING_PROMPT_TEMPLATE.format(theme=theme.lower(), prompt=prompt)
 
 
+@functools.lru_cache(maxsize=512)
 def build_crossword_words_prompt(theme: str, num_words: int) -> str:
     """Build the prompt for crossword word generation"""
-    return (
-        f"Generate EXACTLY {num_words} simple words for a crossword puzzle about the biblical theme '{theme}'. "
-        f"{CROSSWORD_CONFIG['format_instruction']} "
-        f"Focus on key characters, objects, and concepts from the {theme} story. "
-        f"Make sure to return exactly {num_words} words."
-    )
+    return _CROSSWORD_PROMPT_TEMPLATE.format(theme=theme, num_words=num_words)
 
 
+@functools.lru_cache(maxsize=512)
 def build_pamphlet_content_prompt(theme: str) -> str:
     """Build the prompt for comprehensive pamphlet content generation"""
-    return f'''Generate complete pamphlet content for a kids church activity pamphlet about the biblical theme "{theme}".
+    return build_combined_prompt(theme)
+
+
+def build_quiz_batch_prompt(themes: tuple, num_questions: int) -> str:
+    """Build a single prompt covering quiz generation for several themes"""
+    theme_list = ', '.join(f'"{theme}"' for theme in themes)
+    return _QUIZ_BATCH_PROMPT_TEMPLATE.format(
+        themes=theme_list, num_questions=num_questions
+    )
+
+
+# Fixed instruction preamble for combined content generation. Kept free
+# of the theme so providers with prompt caching (Anthropic
+# cache_control) can cache it as a stable prefix across all themes.
+COMBINED_PROMPT_INSTRUCTIONS = '''Generate complete pamphlet content for a kids church activity pamphlet about the biblical theme given at the end of this message.
 
 Return ALL content in this exact JSON format:
 {{
@@ -100,17 +208,75 @@ Return ALL content in this exact JSON format:
 }}
 
 REQUIREMENTS:
-- Generate exactly 5 quiz questions with simple, short answers for 5-year-olds
-- Generate exactly 8 words (3-8 letters, UPPERCASE) for word search and crossword
+- Generate exactly {num_questions} quiz questions with simple, short answers for 5-year-olds
+- Generate exactly {num_words} words (3-8 letters, UPPERCASE) for word search and crossword
 - Generate exactly 5 missing letter words: format as "L E T T E _ S" with spaces between letters, one middle letter as _
 - Generate one kid-friendly phrase (5-8 words) for word completion
 - Generate one fun maze goal description (10-15 words)
 - Generate one theme-appropriate word or short phrase (1-3 words, UPPERCASE) for coloringText (e.g., "ARK", "NOAH", "CREATION", "GOD", "JESUS", "LOVE", "SHEPHERD")
 - Generate detailed coloringTextPrompt: "large decorative coloring book style text [coloringText] with [theme] patterns, black and white line art, bold thick letters suitable for children to color"
 - Generate detailed coloringScenePrompt: theme-specific cartoon scene description (e.g., "Noah's ark floating on water with animals", "sun in sky, ocean, trees, animals", "shepherd with staff, sheep in field"). Must be simple line art, black and white, suitable for children's coloring book
-- All content must match the "{theme}" theme
-- Make sure all words and phrases are biblical and appropriate for children
-'''
+- All content must match the given theme
+- Make sure all words and phrases are biblical and appropriate for children'''
+
+
+@functools.lru_cache(maxsize=512)
+def build_combined_prompt_blocks(theme: str, num_questions: int = 5, num_words: int = 8) -> tuple:
+    """
+    Build the combined prompt as (fixed instructions, short theme text)
+
+    Providers that support prefix caching can mark the instruction block
+    cacheable and pay input tokens only for the theme line.
+    """
+    instructions = COMBINED_PROMPT_INSTRUCTIONS.format(
+        num_questions=num_questions, num_words=num_words
+    )
+    return instructions, f'The theme is: "{theme}"'
+
+
+@functools.lru_cache(maxsize=512)
+def build_combined_prompt(theme: str, num_questions: int = 5, num_words: int = 8) -> str:
+    """
+    Build the prompt for combined content generation
+
+    Same JSON schema as the pamphlet prompt, with the quiz and word
+    counts parameterized so one LLM round trip can also serve the
+    standalone quiz and crossword endpoints.
+    """
+    instructions, theme_text = build_combined_prompt_blocks(theme, num_questions, num_words)
+    return f'{instructions}\n\n{theme_text}\n'
+
+
+class QuizQuestion(BaseModel):
+    q: str
+    a: str
+
+
+class MissingLetterWord(BaseModel):
+    word: str
+    missing: str
+
+
+class PamphletContent(BaseModel):
+    """
+    Schema of the combined/pamphlet LLM response
+
+    Validated with pydantic-core before any image calls are awaited, so
+    malformed model output fails in microseconds instead of deep inside
+    the image threads. Quiz and word list are required; the rest default
+    so a minor omission doesn't fail the whole pamphlet. Extra keys are
+    kept to stay forward-compatible with prompt changes.
+    """
+    model_config = ConfigDict(extra='allow')
+
+    quizQuestions: List[QuizQuestion]
+    wordList: List[str]
+    missingLetterWords: List[MissingLetterWord] = []
+    wordCompletionPhrase: str = ''
+    mazeGoal: str = ''
+    coloringText: str = ''
+    coloringTextPrompt: Optional[str] = None
+    coloringScenePrompt: Optional[str] = None
 
 
 class AIServiceBase(ABC):
@@ -196,7 +362,28 @@ class AIServiceBase(ABC):
             NotImplementedError: If provider not implemented
         """
         raise NotImplementedError("generate_pamphlet_content not implemented for this provider")
-    
+
+    def generate_all(self, theme: str, num_questions: int = 5, num_words: int = 8) -> dict:
+        """
+        Generate quiz questions, word list and pamphlet text in one LLM call
+
+        Text-only variant of generate_pamphlet_content: no coloring
+        images are generated, so it is cheap enough for the standalone
+        quiz and crossword endpoints to slice from.
+
+        Args:
+            theme: Biblical theme context
+            num_questions: Number of quiz questions to generate
+            num_words: Number of crossword/word-search words to generate
+
+        Returns:
+            Dict with quizQuestions, wordList, missingLetterWords, wordCompletionPhrase, mazeGoal
+
+        Raises:
+            NotImplementedError: If provider not implemented
+        """
+        raise NotImplementedError("generate_all not implemented for this provider")
+
     @abstractmethod
     def is_enabled(self) -> bool:
         """Check if this AI service is properly configured"""
@@ -206,19 +393,30 @@ class AIServiceBase(ABC):
         """
         Parse quiz questions from AI response
         Expects format: Question?\nANSWER\n\n
+
+        Single pass over the lines: no intermediate per-block lists, and
+        parsing stops as soon as num_questions are collected.
         """
         questions = []
-        
-        for block in text.split('\n\n'):
-            if not block.strip():
-                continue
-            lines = [line.strip() for line in block.split('\n') if line.strip()]
-            if len(lines) >= 2:
-                questions.append({
-                    'q': lines[0].rstrip('?'),
-                    'a': lines[1].upper().strip()
-                })
-        
+        current = None
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                # Blank line closes the current question block
+                if current is not None and 'a' in current:
+                    questions.append(current)
+                    if len(questions) >= num_questions:
+                        return questions
+                current = None
+            elif current is None:
+                current = {'q': line.rstrip('?')}
+            elif 'a' not in current:
+                current['a'] = line.upper()
+
+        if current is not None and 'a' in current:
+            questions.append(current)
+
         return questions[:num_questions]
     
     def _parse_crossword_words_response(self, text: str, num_words: int = 8) -> list:
@@ -235,12 +433,18 @@ class AIServiceBase(ABC):
         # Filter out invalid words (too short, too long, or contains spaces)
         valid_words = [w for w in words if len(w) >= 3 and len(w) <= 10 and ' ' not in w and w.isalpha()]
         
-        # If we got fewer valid words than requested, try parsing from entire text
+        # If we got fewer valid words than requested, scan the entire text.
+        # finditer with an early break avoids materializing every match,
+        # and the same length/isalpha filter applies as on the first line.
         if len(valid_words) < num_words:
-            # Try finding all uppercase words in the response
-            import re
-            all_uppercase_words = re.findall(r'\b[A-Z]{3,10}\b', text)
-            valid_words = list(dict.fromkeys(all_uppercase_words))  # Remove duplicates
-        
+            seen = set(valid_words)
+            for match in _UPPER_WORD_RE.finditer(text):
+                word = match.group(0)
+                if word not in seen and 3 <= len(word) <= 10 and ' ' not in word and word.isalpha():
+                    seen.add(word)
+                    valid_words.append(word)
+                    if len(valid_words) >= num_words:
+                        break
+
         return valid_words[:num_words]
 
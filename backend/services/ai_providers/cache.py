@@ -0,0 +1,141 @@
+"""
+Response cache for LLM calls
+
+Identical themes arrive repeatedly across users and sessions; a cache
+hit returns in under a millisecond instead of a multi-second (and
+billed) provider round trip. Backed by diskcache when installed so hits
+survive restarts and are shared across gunicorn workers; falls back to
+a per-process in-memory cache otherwise.
+"""
+
+import time
+import hashlib
+import functools
+import threading
+from pathlib import Path
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+# Opened lazily: provider modules import while app.py builds its
+# singletons, which under gunicorn's preload_app happens in the master.
+# A diskcache opened there would carry its SQLite connection across
+# fork() into every worker, which SQLite forbids. First use runs inside
+# a worker, after fork.
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def _get_disk_cache():
+    """The shared diskcache, opened on first use (None when not installed)"""
+    global _disk_cache
+    if _disk_cache is None and diskcache is not None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                cache_dir = Path(__file__).parent.parent.parent / '.cache' / 'llm'
+                _disk_cache = diskcache.Cache(str(cache_dir))
+    return _disk_cache
+
+# In-memory fallback when diskcache isn't installed
+_memory_cache = {}
+_MEMORY_CACHE_MAX = 256
+
+# Single-flight registry: when N threads miss the cache on the same key
+# within the same window, one calls the provider and the rest wait for
+# its result instead of issuing N identical (billed) round trips.
+# Thread-based because provider methods are sync and run under
+# asyncio.to_thread.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _cache_key(service, func_name: str, args, kwargs) -> str:
+    """Build a stable key from provider, model, call args and prompt version"""
+    from .base import PROMPT_VERSION
+    raw = '|'.join([
+        getattr(service, 'provider_name', ''),
+        getattr(service, 'model', ''),
+        func_name,
+        repr(args),
+        repr(sorted(kwargs.items())),
+        str(PROMPT_VERSION),
+    ])
+    return hashlib.blake2b(raw.encode()).hexdigest()
+
+
+def _is_cacheable(result) -> bool:
+    """Don't pin partial failures (e.g. missing coloring images) for a day"""
+    return not (isinstance(result, dict) and result.get('coloringImageError'))
+
+
+def disk_cached(ttl: int = 86400):
+    """
+    Cache a service method's result per (provider, model, args)
+
+    The wrapped method's self must expose provider_name and model; the
+    key also includes PROMPT_VERSION from base.py so prompt or schema
+    changes bust stale entries.
+    """
+    def decorator(func):
+        def _lookup(key):
+            disk_cache = _get_disk_cache()
+            if disk_cache is not None:
+                return disk_cache.get(key)
+            entry = _memory_cache.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    return value
+                del _memory_cache[key]
+            return None
+
+        def _store(key, result):
+            if _is_cacheable(result):
+                disk_cache = _get_disk_cache()
+                if disk_cache is not None:
+                    disk_cache.set(key, result, expire=ttl)
+                else:
+                    if len(_memory_cache) >= _MEMORY_CACHE_MAX:
+                        _memory_cache.clear()
+                    _memory_cache[key] = (result, time.monotonic() + ttl)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = _cache_key(self, func.__name__, args, kwargs)
+
+            cached = _lookup(key)
+            if cached is not None:
+                return cached
+
+            # Single flight: first thread in becomes the leader and
+            # calls the provider; concurrent callers with the same key
+            # wait on its entry instead of duplicating the call
+            with _inflight_lock:
+                entry = _inflight.get(key)
+                if entry is None:
+                    entry = {'event': threading.Event()}
+                    _inflight[key] = entry
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                entry['event'].wait()
+                if 'result' in entry:
+                    return entry['result']
+                # Leader raised - fall through and try ourselves
+
+            try:
+                result = func(self, *args, **kwargs)
+                _store(key, result)
+                entry['result'] = result
+                return result
+            finally:
+                if leader:
+                    with _inflight_lock:
+                        _inflight.pop(key, None)
+                    entry['event'].set()
+        return wrapper
+    return decorator
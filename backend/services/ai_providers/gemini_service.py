@@ -4,11 +4,117 @@ Google Gemini implementation
 
 import os
 import json
-import re
+import functools
+import orjson
+import atexit
+import threading
+import concurrent.futures
 import requests
-import base64
-from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, build_quiz_user_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, build_quiz_user_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt, build_quiz_batch_prompt, extract_json_block, COLORING_PROMPT_FIELDS, COLORING_PROMPT_FIELD_RES
 from utils.tracking import track_llm_call
+from .cache import disk_cached
+
+# Shared worker pool for coloring-image fan-out. A per-request
+# ThreadPoolExecutor(max_workers=2) pays thread spawn and teardown on
+# every pamphlet; a process-wide pool amortizes that and bounds total
+# image threads across concurrent sessions. Built lazily so the
+# IMAGE_WORKERS env var is read after .env is loaded.
+_IMAGE_EXECUTOR = None
+_IMAGE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _image_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _IMAGE_EXECUTOR
+    if _IMAGE_EXECUTOR is None:
+        with _IMAGE_EXECUTOR_LOCK:
+            if _IMAGE_EXECUTOR is None:
+                _IMAGE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(os.getenv('IMAGE_WORKERS', '4')),
+                    thread_name_prefix="gemini-img"
+                )
+                atexit.register(_IMAGE_EXECUTOR.shutdown, wait=True)
+    return _IMAGE_EXECUTOR
+
+# Shared session for Gemini REST calls. Keep-alive reuses the TCP+TLS
+# connection to generativelanguage.googleapis.com, so the second image
+# call of a pamphlet skips the full handshake.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # POST is not retried by default; these calls are safe to repeat
+    # (idempotent generation requests), and absorbing a transient 429/5xx
+    # here saves re-running the ~5s text generation that preceded it
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['POST']),
+        respect_retry_after_header=True
+    )
+))
+
+
+def get_session() -> requests.Session:
+    """Shared REST session (exposed so tests can swap or inspect it)"""
+    return _SESSION
+
+
+# Gemini has no separate system turn, so the system prompt is prepended
+# to the user prompt; the immutable prefixes are concatenated once here
+# instead of per call
+_QUIZ_PREFIX = QUIZ_GENERATION_CONFIG['system_prompt'] + "\n\n"
+_CROSSWORD_PREFIX = CROSSWORD_CONFIG['system_prompt'] + "\n\n"
+_PAMPHLET_PREFIX = PAMPHLET_CONTENT_CONFIG['system_prompt'] + "\n\n"
+
+# Full crossword-puzzle prompt as a module template; only the theme
+# varies, so the ~600-byte fixed text is never re-concatenated per call
+_CROSSWORD_PUZZLE_PROMPT_TMPL = '''You are creating a crossword puzzle for 5-year-old children about the biblical theme "{theme}".
+
+REQUIREMENTS:
+- Generate exactly 8 words (3-8 letters each)
+- Words must intersect and share letters
+- All words must be related to the theme
+- Use simple, kid-friendly clues
+- Grid must be 10x10 cells maximum
+
+Return ONLY valid JSON in this format:
+{{
+  "title": "{theme} Crossword",
+  "grid": [["A","R","K","",""],["","","N","",""],["","","O","",""],["","","A","",""],["","","H","",""]],
+  "words": [
+    {{ "number": 1, "direction": "across", "row": 0, "col": 0, "clue": "What Noah built", "answer": "ARK" }},
+    {{ "number": 2, "direction": "down", "row": 0, "col": 2, "clue": "Who built the boat", "answer": "NOAH" }}
+  ]
+}}
+
+CRITICAL: The grid must exactly match where the words are placed. Use "" for empty cells.'''
+
+
+@functools.lru_cache(maxsize=64)
+def _build_crossword_prompt(theme: str) -> str:
+    """Crossword prompt per theme, built once for the process lifetime"""
+    return _CROSSWORD_PUZZLE_PROMPT_TMPL.format(theme=theme)
+
+
+# One GenerativeModel per (api_key, model), shared by every
+# GeminiService instance so the SDK's transport channel is reused
+# instead of being rebuilt per short-lived service object
+_MODEL_CACHE = {}
+
+
+def _get_model(api_key: str, model: str):
+    """Return a cached GenerativeModel, creating it on first use"""
+    key = (api_key, model)
+    cached = _MODEL_CACHE.get(key)
+    if cached is None:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        cached = genai.GenerativeModel(model)
+        _MODEL_CACHE[key] = cached
+    return cached
 
 
 class GeminiService(AIServiceBase):
@@ -23,9 +129,10 @@ class GeminiService(AIServiceBase):
         
         if self.api_key:
             try:
-                import google.generativeai as genai
-                genai.configure(api_key=self.api_key)
-                self._client = genai.GenerativeModel(self.model)
+                self._client = _get_model(self.api_key, self.model)
+                # Sent once per request; avoids rebuilding the headers
+                # dict on every image call
+                _SESSION.headers['x-goog-api-key'] = self.api_key
                 print(f"✅ Gemini client initialized with API key")
             except ImportError:
                 print("⚠️  Google Generative AI package not installed. Run: pip install google-generativeai")
@@ -83,16 +190,15 @@ class GeminiService(AIServiceBase):
             "generationConfig": generation_config
         }
         
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": self.api_key
-        }
-        
         try:
-            response = requests.post(api_url, json=payload, headers=headers, timeout=60)
+            response = _SESSION.post(api_url, json=payload, timeout=60)
             response.raise_for_status()
             
-            result = response.json()
+            # Parse the raw bytes with orjson: response.json() first
+            # decodes the multi-MB body (mostly base64 PNG) into a Python
+            # str, then parses it with stdlib json; orjson skips the str
+            # copy and parses ~3x faster
+            result = orjson.loads(response.content)
             
             # Extract image data from response
             if 'candidates' not in result or not result['candidates']:
@@ -102,26 +208,24 @@ class GeminiService(AIServiceBase):
             if 'content' not in candidate or 'parts' not in candidate['content']:
                 raise Exception("No content parts in response")
             
-            image_data = None
+            image_base64 = None
+            mime_type = "image/png"  # Gemini typically returns PNG
             for part in candidate['content']['parts']:
                 # Check for inline_data with image
                 if 'inlineData' in part:
                     inline_data = part['inlineData']
-                    if 'data' in inline_data:
-                        # Decode base64 image data
-                        image_data = base64.b64decode(inline_data['data'])
-                        if image_data:
-                            break
+                    if inline_data.get('data'):
+                        # The payload is already base64 on the wire, so it
+                        # goes straight into the data URI; decoding and
+                        # re-encoding ~1-2 MB per image bought nothing
+                        image_base64 = inline_data['data']
+                        mime_type = inline_data.get('mimeType', mime_type)
+                        break
             
-            if not image_data:
+            if not image_base64:
                 raise Exception("No image data found in response. The model may not support image generation via REST API.")
             
-            # Convert image data to base64 data URI for frontend
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            mime_type = "image/png"  # Gemini typically returns PNG
-            data_uri = f"data:{mime_type};base64,{image_base64}"
-            
-            return data_uri
+            return f"data:{mime_type};base64,{image_base64}"
             
         except requests.exceptions.HTTPError as e:
             error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
@@ -136,6 +240,7 @@ class GeminiService(AIServiceBase):
             error_msg = str(e)
             raise Exception(f"Failed to generate image with Gemini: {error_msg}")
     
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_quiz_questions')
     def generate_quiz_questions(self, theme: str, num_questions: int = 10) -> list:
         """Generate quiz questions using Google Gemini"""
@@ -143,11 +248,7 @@ class GeminiService(AIServiceBase):
             raise Exception("Gemini service is not properly configured")
         
         try:
-            # Gemini doesn't have separate system/user, combine them
-            full_prompt = (
-                f"{QUIZ_GENERATION_CONFIG['system_prompt']}\n\n"
-                f"{build_quiz_user_prompt(theme, num_questions)}"
-            )
+            full_prompt = _QUIZ_PREFIX + build_quiz_user_prompt(theme, num_questions)
             
             response = self._client.generate_content(
                 full_prompt,
@@ -162,7 +263,42 @@ class GeminiService(AIServiceBase):
             
         except Exception as e:
             raise Exception(f"Failed to generate questions with Gemini: {str(e)}")
-    
+
+    def generate_quiz_questions_batch(self, themes: list, num_questions: int = 10) -> dict:
+        """
+        Generate quiz questions for several themes in one LLM call
+
+        One round trip shares the system prompt across all themes instead
+        of paying a call per theme (weekly rotation, backfill). Themes the
+        model skipped are omitted from the result.
+
+        Returns:
+            Dict mapping theme -> list of question dicts
+        """
+        if not self.is_enabled():
+            raise Exception("Gemini service is not properly configured")
+
+        if len(themes) == 1:
+            return {themes[0]: self.generate_quiz_questions(themes[0], num_questions)}
+
+        try:
+            full_prompt = _QUIZ_PREFIX + build_quiz_batch_prompt(tuple(themes), num_questions)
+
+            response = self._client.generate_content(
+                full_prompt,
+                generation_config={
+                    'temperature': QUIZ_GENERATION_CONFIG['temperature'],
+                    'max_output_tokens': QUIZ_GENERATION_CONFIG['max_tokens'] * len(themes),
+                }
+            )
+
+            parsed = orjson.loads(extract_json_block(response.text))
+            return {theme: parsed[theme] for theme in themes if parsed.get(theme)}
+
+        except Exception as e:
+            raise Exception(f"Failed to generate batch quiz questions with Gemini: {str(e)}")
+
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_crossword_words')
     def generate_crossword_words(self, theme: str, num_words: int = 8) -> list:
         """Generate crossword words using Google Gemini"""
@@ -170,11 +306,7 @@ class GeminiService(AIServiceBase):
             raise Exception("Gemini service is not properly configured")
         
         try:
-            # Gemini doesn't have separate system/user, combine them
-            full_prompt = (
-                f"{CROSSWORD_CONFIG['system_prompt']}\n\n"
-                f"{build_crossword_words_prompt(theme, num_words)}"
-            )
+            full_prompt = _CROSSWORD_PREFIX + build_crossword_words_prompt(theme, num_words)
             
             response = self._client.generate_content(
                 full_prompt,
@@ -190,31 +322,13 @@ class GeminiService(AIServiceBase):
         except Exception as e:
             raise Exception(f"Failed to generate crossword words with Gemini: {str(e)}")
     
+    @disk_cached(ttl=86400)
     def generate_crossword(self, theme: str) -> dict:
         """Generate a complete crossword puzzle with grid and clues using Gemini"""
         if not self.is_enabled():
             raise Exception("Gemini service is not properly configured")
         
-        prompt = f'''You are creating a crossword puzzle for 5-year-old children about the biblical theme "{theme}".
-
-REQUIREMENTS:
-- Generate exactly 8 words (3-8 letters each)
-- Words must intersect and share letters
-- All words must be related to the theme
-- Use simple, kid-friendly clues
-- Grid must be 10x10 cells maximum
-
-Return ONLY valid JSON in this format:
-{{
-  "title": "{theme} Crossword",
-  "grid": [["A","R","K","",""],["","","N","",""],["","","O","",""],["","","A","",""],["","","H","",""]],
-  "words": [
-    {{ "number": 1, "direction": "across", "row": 0, "col": 0, "clue": "What Noah built", "answer": "ARK" }},
-    {{ "number": 2, "direction": "down", "row": 0, "col": 2, "clue": "Who built the boat", "answer": "NOAH" }}
-  ]
-}}
-
-CRITICAL: The grid must exactly match where the words are placed. Use "" for empty cells.'''
+        prompt = _build_crossword_prompt(theme)
 
         try:
             response = self._client.generate_content(
@@ -227,17 +341,7 @@ CRITICAL: The grid must exactly match where the words are placed. Use "" for emp
             
             text = response.text
             
-            # Extract JSON from markdown code blocks if present
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    text = json_match.group(0)
-            
-            puzzle = json.loads(text)
+            puzzle = orjson.loads(extract_json_block(text))
             return puzzle
             
         except json.JSONDecodeError as e:
@@ -245,6 +349,7 @@ CRITICAL: The grid must exactly match where the words are placed. Use "" for emp
         except Exception as e:
             raise Exception(f"Failed to generate crossword with Gemini: {str(e)}")
     
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_pamphlet_content')
     def generate_pamphlet_content(self, theme: str) -> dict:
         """Generate all pamphlet content in one LLM call, then generate coloring images"""
@@ -252,57 +357,57 @@ CRITICAL: The grid must exactly match where the words are placed. Use "" for emp
             raise Exception("Gemini service is not properly configured")
         
         try:
-            # Build the combined prompt
-            full_prompt = (
-                f"{PAMPHLET_CONTENT_CONFIG['system_prompt']}\n\n"
-                f"{build_pamphlet_content_prompt(theme)}"
-            )
-            
+            full_prompt = _PAMPHLET_PREFIX + build_pamphlet_content_prompt(theme)
+
+            # Stream the response so each coloring-image call starts the
+            # moment its prompt field completes in the partial JSON,
+            # overlapping image generation with the rest of the stream
+            futures = {}      # dest key -> Future
+            submitted = {}    # prompt text -> Future (dedup identical prompts)
+            buffer = ''
             response = self._client.generate_content(
                 full_prompt,
                 generation_config={
                     'temperature': PAMPHLET_CONTENT_CONFIG['temperature'],
                     'max_output_tokens': PAMPHLET_CONTENT_CONFIG['max_tokens'],
-                }
+                },
+                stream=True
             )
-            
-            text = response.text
-            
-            # Extract JSON from markdown code blocks if present
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    text = json_match.group(0)
-            
-            content = json.loads(text)
+            for chunk in response:
+                buffer += chunk.text
+                for field, dest in COLORING_PROMPT_FIELDS:
+                    if dest in futures:
+                        continue
+                    match = COLORING_PROMPT_FIELD_RES[field].search(buffer)
+                    if match:
+                        # Re-parse the raw JSON string value to unescape it
+                        prompt = orjson.loads(f'"{match.group(1)}"')
+                        # Identical text/scene prompts share one API call
+                        if prompt not in submitted:
+                            submitted[prompt] = _image_executor().submit(
+                                self.generate_coloring_image, prompt, theme
+                            )
+                        futures[dest] = submitted[prompt]
+
+            content = orjson.loads(extract_json_block(buffer))
             
             # Generate coloring images if prompts are available
             if 'coloringTextPrompt' in content and 'coloringScenePrompt' in content:
                 try:
-                    # Generate both images in parallel using threading
-                    import concurrent.futures
-                    
-                    def generate_text_image():
-                        return self.generate_coloring_image(
-                            content['coloringTextPrompt'], theme
-                        )
-                    
-                    def generate_scene_image():
-                        return self.generate_coloring_image(
-                            content['coloringScenePrompt'], theme
-                        )
-                    
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                        text_future = executor.submit(generate_text_image)
-                        scene_future = executor.submit(generate_scene_image)
-                        
-                        content['coloringTextImageUrl'] = text_future.result()
-                        content['coloringSceneImageUrl'] = scene_future.result()
-                        
+                    # Safety net: submit any prompt the streaming scan
+                    # missed (e.g. unusual escaping in the partial JSON)
+                    for field, dest in COLORING_PROMPT_FIELDS:
+                        if dest not in futures:
+                            prompt = content[field]
+                            if prompt not in submitted:
+                                submitted[prompt] = _image_executor().submit(
+                                    self.generate_coloring_image, prompt, theme
+                                )
+                            futures[dest] = submitted[prompt]
+
+                    content['coloringTextImageUrl'] = futures['coloringTextImageUrl'].result()
+                    content['coloringSceneImageUrl'] = futures['coloringSceneImageUrl'].result()
+
                 except Exception as e:
                     error_msg = f"Gemini image generation failed: {str(e)}"
                     print(f"⚠️  {error_msg}")
@@ -4,9 +4,61 @@ OpenAI GPT and DALL·E implementation
 
 import os
 import json
-import re
-from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, COLORING_IMAGE_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, build_quiz_user_prompt, build_coloring_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt
+import orjson
+import atexit
+import threading
+import concurrent.futures
+from .base import AIServiceBase, QUIZ_GENERATION_CONFIG, COLORING_IMAGE_CONFIG, CROSSWORD_CONFIG, PAMPHLET_CONTENT_CONFIG, build_quiz_user_prompt, build_coloring_prompt, build_crossword_words_prompt, build_pamphlet_content_prompt, build_quiz_batch_prompt, extract_json_block, COLORING_PROMPT_FIELDS, COLORING_PROMPT_FIELD_RES
 from utils.tracking import track_llm_call
+from .cache import disk_cached
+
+# Shared worker pool for coloring-image fan-out. A per-request
+# ThreadPoolExecutor(max_workers=2) pays thread spawn and teardown on
+# every pamphlet; a process-wide pool amortizes that and bounds total
+# image threads across concurrent sessions. Built lazily so the
+# IMAGE_WORKERS env var is read after .env is loaded.
+_IMAGE_EXECUTOR = None
+_IMAGE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _image_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _IMAGE_EXECUTOR
+    if _IMAGE_EXECUTOR is None:
+        with _IMAGE_EXECUTOR_LOCK:
+            if _IMAGE_EXECUTOR is None:
+                _IMAGE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(os.getenv('IMAGE_WORKERS', '4')),
+                    thread_name_prefix="openai-img"
+                )
+                atexit.register(_IMAGE_EXECUTOR.shutdown, wait=True)
+    return _IMAGE_EXECUTOR
+
+
+# One OpenAI client per API key, shared by every OpenAIService instance.
+# The SDK builds an httpx connection pool per client, so per-instance
+# construction would pay a fresh TCP+TLS handshake to api.openai.com on
+# every short-lived service object.
+_CLIENT_CACHE = {}
+
+
+def _get_client(api_key: str):
+    """Return a cached OpenAI client for this API key, creating it on first use"""
+    client = _CLIENT_CACHE.get(api_key)
+    if client is None:
+        import httpx
+        from openai import OpenAI
+        # SDK-level backoff on transient 429/5xx, so one flaky image
+        # call can't discard a completed text generation
+        client = OpenAI(
+            api_key=api_key,
+            max_retries=3,
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                timeout=60
+            )
+        )
+        _CLIENT_CACHE[api_key] = client
+    return client
 
 
 class OpenAIService(AIServiceBase):
@@ -20,14 +72,15 @@ class OpenAIService(AIServiceBase):
         
         if self.api_key:
             try:
-                from openai import OpenAI
-                self._client = OpenAI(api_key=self.api_key)
+                self._client = _get_client(self.api_key)
             except ImportError:
                 print("⚠️  OpenAI package not installed. Run: pip install openai")
     
     def is_enabled(self) -> bool:
         return self._client is not None and self.api_key is not None
     
+    # Short TTL: DALL·E result URLs expire about an hour after generation
+    @disk_cached(ttl=3600)
     @track_llm_call('generate_coloring_image')
     def generate_coloring_image(self, prompt: str, theme: str) -> str:
         """Generate image using DALL·E 3"""
@@ -50,6 +103,7 @@ class OpenAIService(AIServiceBase):
         except Exception as e:
             raise Exception(f"Failed to generate image with OpenAI: {str(e)}")
     
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_quiz_questions')
     def generate_quiz_questions(self, theme: str, num_questions: int = 10) -> list:
         """Generate quiz questions using OpenAI GPT"""
@@ -72,7 +126,42 @@ class OpenAIService(AIServiceBase):
             
         except Exception as e:
             raise Exception(f"Failed to generate questions with OpenAI: {str(e)}")
-    
+
+    def generate_quiz_questions_batch(self, themes: list, num_questions: int = 10) -> dict:
+        """
+        Generate quiz questions for several themes in one LLM call
+
+        One round trip shares the system prompt across all themes instead
+        of paying a call per theme (weekly rotation, backfill). Themes the
+        model skipped are omitted from the result.
+
+        Returns:
+            Dict mapping theme -> list of question dicts
+        """
+        if not self.is_enabled():
+            raise Exception("OpenAI service is not properly configured")
+
+        if len(themes) == 1:
+            return {themes[0]: self.generate_quiz_questions(themes[0], num_questions)}
+
+        try:
+            response = self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": QUIZ_GENERATION_CONFIG['system_prompt']},
+                    {"role": "user", "content": build_quiz_batch_prompt(tuple(themes), num_questions)}
+                ],
+                temperature=QUIZ_GENERATION_CONFIG['temperature'],
+                max_tokens=QUIZ_GENERATION_CONFIG['max_tokens'] * len(themes)
+            )
+
+            parsed = orjson.loads(extract_json_block(response.choices[0].message.content))
+            return {theme: parsed[theme] for theme in themes if parsed.get(theme)}
+
+        except Exception as e:
+            raise Exception(f"Failed to generate batch quiz questions with OpenAI: {str(e)}")
+
+    @disk_cached(ttl=86400)
     @track_llm_call('generate_crossword_words')
     def generate_crossword_words(self, theme: str, num_words: int = 8) -> list:
         """Generate crossword words using OpenAI GPT"""
@@ -96,6 +185,9 @@ class OpenAIService(AIServiceBase):
         except Exception as e:
             raise Exception(f"Failed to generate crossword words with OpenAI: {str(e)}")
     
+    # Short TTL: the pamphlet dict embeds DALL-E URLs, which expire ~1h
+    # after generation
+    @disk_cached(ttl=3600)
     @track_llm_call('generate_pamphlet_content')
     def generate_pamphlet_content(self, theme: str) -> dict:
         """Generate all pamphlet content in one LLM call, then generate coloring images"""
@@ -103,59 +195,60 @@ class OpenAIService(AIServiceBase):
             raise Exception("OpenAI service is not properly configured")
         
         try:
-            # Build the combined prompt
-            full_prompt = (
-                f"{PAMPHLET_CONTENT_CONFIG['system_prompt']}\n\n"
-                f"{build_pamphlet_content_prompt(theme)}"
-            )
-            
-            response = self._client.chat.completions.create(
+            # Stream the response so each DALL-E call starts the moment
+            # its prompt field completes in the partial JSON, overlapping
+            # image generation with the rest of the stream
+            futures = {}      # dest key -> Future
+            submitted = {}    # prompt text -> Future (dedup identical prompts)
+            buffer = ''
+            stream = self._client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": PAMPHLET_CONTENT_CONFIG['system_prompt']},
                     {"role": "user", "content": build_pamphlet_content_prompt(theme)}
                 ],
                 temperature=PAMPHLET_CONTENT_CONFIG['temperature'],
-                max_tokens=PAMPHLET_CONTENT_CONFIG['max_tokens']
+                max_tokens=PAMPHLET_CONTENT_CONFIG['max_tokens'],
+                stream=True
             )
-            
-            text = response.choices[0].message.content
-            
-            # Extract JSON from markdown code blocks if present
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                if json_match:
-                    text = json_match.group(0)
-            
-            content = json.loads(text)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                buffer += delta
+                for field, dest in COLORING_PROMPT_FIELDS:
+                    if dest in futures:
+                        continue
+                    match = COLORING_PROMPT_FIELD_RES[field].search(buffer)
+                    if match:
+                        # Re-parse the raw JSON string value to unescape it
+                        prompt = orjson.loads(f'"{match.group(1)}"')
+                        # Identical text/scene prompts share one API call
+                        if prompt not in submitted:
+                            submitted[prompt] = _image_executor().submit(
+                                self.generate_coloring_image, prompt, theme
+                            )
+                        futures[dest] = submitted[prompt]
+
+            content = orjson.loads(extract_json_block(buffer))
             
             # Generate coloring images if prompts are available
             if 'coloringTextPrompt' in content and 'coloringScenePrompt' in content:
                 try:
-                    # Generate both images in parallel using threading
-                    import concurrent.futures
-                    
-                    def generate_text_image():
-                        return self.generate_coloring_image(
-                            content['coloringTextPrompt'], theme
-                        )
-                    
-                    def generate_scene_image():
-                        return self.generate_coloring_image(
-                            content['coloringScenePrompt'], theme
-                        )
-                    
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                        text_future = executor.submit(generate_text_image)
-                        scene_future = executor.submit(generate_scene_image)
-                        
-                        content['coloringTextImageUrl'] = text_future.result()
-                        content['coloringSceneImageUrl'] = scene_future.result()
-                        
+                    # Safety net: submit any prompt the streaming scan
+                    # missed (e.g. unusual escaping in the partial JSON)
+                    for field, dest in COLORING_PROMPT_FIELDS:
+                        if dest not in futures:
+                            prompt = content[field]
+                            if prompt not in submitted:
+                                submitted[prompt] = _image_executor().submit(
+                                    self.generate_coloring_image, prompt, theme
+                                )
+                            futures[dest] = submitted[prompt]
+
+                    content['coloringTextImageUrl'] = futures['coloringTextImageUrl'].result()
+                    content['coloringSceneImageUrl'] = futures['coloringSceneImageUrl'].result()
+
                 except Exception as e:
                     error_msg = f"OpenAI image generation failed: {str(e)}"
                     print(f"⚠️  {error_msg}")
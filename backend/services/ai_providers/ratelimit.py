@@ -0,0 +1,77 @@
+"""
+Client-side rate limiting for LLM providers
+
+A token bucket per provider applies backpressure before a burst of
+pamphlet requests hits the provider's RPM/TPM limits, so calls queue
+briefly on our side instead of burning round trips into 429 responses.
+"""
+
+import os
+import time
+import threading
+
+
+class RateLimiter:
+    """Token-bucket limiter covering both requests/minute and tokens/minute"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(float(self.rpm), self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, estimated_tokens: int = 0):
+        """Block until a request slot and the estimated tokens are available"""
+        while True:
+            with self._lock:
+                self._refill()
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0:
+                    if self._requests >= 1 and self._tokens >= estimated_tokens:
+                        self._requests -= 1
+                        self._tokens -= estimated_tokens
+                        return
+                    # Time until enough capacity refills
+                    need_requests = (1 - self._requests) * 60.0 / self.rpm
+                    need_tokens = (estimated_tokens - self._tokens) * 60.0 / self.tpm
+                    wait = max(need_requests, need_tokens, 0.05)
+            time.sleep(min(wait, 5.0))
+
+    def pause(self, seconds: float):
+        """Hold all callers back, e.g. after a 429 with a Retry-After header"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, default_rpm: int = 50, default_tpm: int = 40000) -> RateLimiter:
+    """
+    Shared limiter per provider name
+
+    Limits come from <PROVIDER>_RPM / <PROVIDER>_TPM env vars (e.g.
+    ANTHROPIC_RPM), read lazily on first use so .env values apply.
+    """
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                prefix = provider.upper()
+                rpm = int(os.getenv(f'{prefix}_RPM', default_rpm))
+                tpm = int(os.getenv(f'{prefix}_TPM', default_tpm))
+                limiter = RateLimiter(rpm, tpm)
+                _limiters[provider] = limiter
+    return limiter
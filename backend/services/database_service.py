@@ -3,33 +3,87 @@ Database Service for async MySQL operations
 Handles all database interactions with connection pooling
 """
 
-import os
 import json
-import aiomysql
+import logging
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime, timedelta
 import asyncio
 
+# Prefer asyncmy (C-extension, same API surface as aiomysql) for faster
+# row decoding; fall back to aiomysql if it isn't installed
+try:
+    import asyncmy as mysql_driver
+    from asyncmy.cursors import DictCursor
+    from asyncmy.errors import MySQLError as MySQLDriverError
+    _DRIVER_NAME = 'asyncmy'
+except ImportError:
+    import aiomysql as mysql_driver
+    from aiomysql import DictCursor
+    MySQLDriverError = mysql_driver.Error
+    _DRIVER_NAME = 'aiomysql'
+
+from config import Config, get_config
+from utils.security import signed_url_suffix
+from utils.tracking import LlmCallLog
+
+logger = logging.getLogger(__name__)
+
+# Telemetry insert batching: rows queued within this window are written
+# as one multi-row INSERT, collapsing N round trips into one
+_LLM_LOG_BATCH_MAX = 200
+_LLM_LOG_FLUSH_SECS = 0.05
+
+_LLM_LOG_INSERT_PREFIX = """
+    INSERT INTO llm_api_calls
+    (provider, model, endpoint, theme, input_tokens, output_tokens,
+     total_tokens, estimated_cost, response_time_ms, success, error_message, request_id)
+    VALUES """
+_LLM_LOG_ROW = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+# Precompiled get_pamphlets filter variants, keyed by
+# (has church_name filter, has theme filter) so the hot list path does
+# an O(1) lookup instead of rebuilding the WHERE string per request
+_PAMPHLET_COLUMNS = (
+    "id, created_at, church_name, theme, file_path, file_name, "
+    "file_size_bytes, llm_call_id, preview_image_path"
+)
+_PAMPHLET_WHERE = {
+    (False, False): "deleted_at IS NULL",
+    (True, False): "deleted_at IS NULL AND church_name LIKE %s",
+    (False, True): "deleted_at IS NULL AND theme LIKE %s",
+    (True, True): "deleted_at IS NULL AND church_name LIKE %s AND theme LIKE %s",
+}
+_PAMPHLET_COUNT = {
+    key: f"SELECT COUNT(*) as total FROM pamphlets WHERE {where}"
+    for key, where in _PAMPHLET_WHERE.items()
+}
+
+_BYTES_TO_MB = 1.0 / (1024 * 1024)
+
 
 class DatabaseService:
     """
     Async MySQL database service for Church Games backend
-    
-    Environment variables:
-    - MYSQL_HOST (default: localhost)
-    - MYSQL_PORT (default: 3306)
-    - MYSQL_USER
-    - MYSQL_PASSWORD
-    - MYSQL_DATABASE
+
+    Configuration comes from the shared Config snapshot (MYSQL_HOST,
+    MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE plus the
+    signed-URL settings); pass a Config explicitly to override it.
     """
-    
-    def __init__(self):
-        self.host = os.getenv('MYSQL_HOST', 'localhost')
-        self.port = int(os.getenv('MYSQL_PORT', 3306))
-        self.user = os.getenv('MYSQL_USER')
-        self.password = os.getenv('MYSQL_PASSWORD')
-        self.database = os.getenv('MYSQL_DATABASE', 'kidschurch')
+
+    def __init__(self, cfg: Optional[Config] = None):
+        cfg = cfg or get_config()
+        self.host = cfg.mysql_host
+        self.port = cfg.mysql_port
+        self.user = cfg.mysql_user
+        self.password = cfg.mysql_password
+        self.database = cfg.mysql_database
+        # When configured, download/preview URLs carry a signed file path
+        # so the endpoints can serve them without a database lookup
+        self._signed_url_secret = cfg.signed_url_secret
+        self._signed_url_ttl = cfg.signed_url_ttl
         self._pool = None
+        self._llm_log_queue = None
+        self._llm_log_task = None
         
     async def initialize(self):
         """Initialize database connection pool"""
@@ -38,7 +92,7 @@ class DatabaseService:
             return False
         
         try:
-            self._pool = await aiomysql.create_pool(
+            self._pool = await mysql_driver.create_pool(
                 host=self.host,
                 port=self.port,
                 user=self.user,
@@ -50,7 +104,9 @@ class DatabaseService:
                 charset='utf8mb4',
                 connect_timeout=10
             )
-            print(f"✅ Database connection pool initialized: {self.database}")
+            self._llm_log_queue = asyncio.Queue()
+            self._llm_log_task = asyncio.create_task(self._llm_log_worker())
+            print(f"✅ Database connection pool initialized: {self.database} ({_DRIVER_NAME})")
             return True
         except Exception as e:
             print(f"❌ Failed to initialize database: {e}")
@@ -58,6 +114,19 @@ class DatabaseService:
     
     async def close(self):
         """Close database connection pool"""
+        if self._llm_log_task:
+            self._llm_log_task.cancel()
+            try:
+                await self._llm_log_task
+            except asyncio.CancelledError:
+                pass
+            self._llm_log_task = None
+            # Flush whatever is still queued so telemetry isn't lost
+            rows = []
+            while not self._llm_log_queue.empty():
+                rows.append(self._llm_log_queue.get_nowait())
+            if rows:
+                await self._flush_llm_log_rows(rows)
         if self._pool:
             self._pool.close()
             await self._pool.wait_closed()
@@ -69,87 +138,131 @@ class DatabaseService:
     
     async def _execute_query(self, query: str, params: Tuple = None) -> List:
         """Execute a SELECT query and return results"""
-        if not self.is_enabled():
+        pool = self._pool
+        if pool is None:
             raise Exception("Database service is not initialized")
-        
+
         try:
-            async with self._pool.acquire() as conn:
-                async with conn.cursor(aiomysql.DictCursor) as cursor:
+            async with pool.acquire() as conn:
+                async with conn.cursor(DictCursor) as cursor:
                     await cursor.execute(query, params)
                     return await cursor.fetchall()
-        except (aiomysql.Error, ConnectionError, OSError) as e:
+        except (MySQLDriverError, ConnectionError, OSError) as e:
             print(f"⚠️  Database query error: {e}")
             print(f"   Query: {query[:200]}...")
             raise
     
     async def _execute_insert(self, query: str, params: Tuple = None) -> int:
         """Execute an INSERT query and return last insert ID"""
-        if not self.is_enabled():
+        pool = self._pool
+        if pool is None:
             raise Exception("Database service is not initialized")
-        
+
         try:
-            async with self._pool.acquire() as conn:
+            async with pool.acquire() as conn:
                 async with conn.cursor() as cursor:
                     await cursor.execute(query, params)
                     return cursor.lastrowid
-        except (aiomysql.Error, ConnectionError, OSError) as e:
+        except (MySQLDriverError, ConnectionError, OSError) as e:
             print(f"⚠️  Database insert error: {e}")
             raise
     
     async def _execute_update(self, query: str, params: Tuple = None) -> int:
         """Execute an UPDATE/DELETE query and return affected rows"""
-        if not self.is_enabled():
+        pool = self._pool
+        if pool is None:
             raise Exception("Database service is not initialized")
-        
+
         try:
-            async with self._pool.acquire() as conn:
+            async with pool.acquire() as conn:
                 async with conn.cursor() as cursor:
                     await cursor.execute(query, params)
                     return cursor.rowcount
-        except (aiomysql.Error, ConnectionError, OSError) as e:
+        except (MySQLDriverError, ConnectionError, OSError) as e:
             print(f"⚠️  Database update error: {e}")
             raise
     
+    async def _llm_log_worker(self):
+        """Background task draining queued LLM log rows into batched INSERTs"""
+        while True:
+            rows = [await self._llm_log_queue.get()]
+            # Coalesce rows that arrive within the flush window
+            try:
+                while len(rows) < _LLM_LOG_BATCH_MAX:
+                    rows.append(await asyncio.wait_for(
+                        self._llm_log_queue.get(), timeout=_LLM_LOG_FLUSH_SECS))
+            except asyncio.TimeoutError:
+                pass
+            await self._flush_llm_log_rows(rows)
+
+    async def _flush_llm_log_rows(self, rows: List[Tuple]):
+        """Write queued log rows with one multi-row INSERT"""
+        query = _LLM_LOG_INSERT_PREFIX + ", ".join([_LLM_LOG_ROW] * len(rows))
+        flat = tuple(value for row in rows for value in row)
+        try:
+            await self._execute_insert(query, flat)
+        except Exception:
+            # One bad row shouldn't drop the whole batch
+            single = _LLM_LOG_INSERT_PREFIX + _LLM_LOG_ROW
+            for row in rows:
+                try:
+                    await self._execute_insert(single, row)
+                except Exception as e:
+                    print(f"⚠️  Failed to log LLM call: {e}")
+
     async def log_llm_call(self, call_data: Dict) -> Optional[int]:
         """
         Log an LLM API call to the database
-        
+
+        Rows are queued and written in batches by a background task, so
+        this never blocks the caller on a database round trip. The insert
+        id is no longer returned (always None); this is fire-and-forget
+        telemetry and no caller consumed it.
+
         Args:
             call_data: Dictionary with provider, model, endpoint, tokens, etc.
-            
-        Returns:
-            ID of inserted record, or None if failed
         """
-        if not self.is_enabled():
-            return None
-        
-        try:
-            query = """
-                INSERT INTO llm_api_calls 
-                (provider, model, endpoint, theme, input_tokens, output_tokens, 
-                 total_tokens, estimated_cost, response_time_ms, success, error_message, request_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            params = (
-                call_data.get('provider'),
-                call_data.get('model'),
-                call_data.get('endpoint'),
-                call_data.get('theme'),
-                call_data.get('input_tokens', 0),
-                call_data.get('output_tokens', 0),
-                call_data.get('total_tokens', 0),
-                call_data.get('estimated_cost', 0.0),
-                call_data.get('response_time_ms', 0),
-                call_data.get('success', True),
-                call_data.get('error_message'),
-                call_data.get('request_id')
-            )
-            
-            call_id = await self._execute_insert(query, params)
-            return call_id
-        except Exception as e:
-            print(f"⚠️  Failed to log LLM call: {e}")
-            return None
+        self.log_llm_call_nowait(LlmCallLog(
+            provider=call_data.get('provider'),
+            model=call_data.get('model'),
+            endpoint=call_data.get('endpoint'),
+            theme=call_data.get('theme'),
+            input_tokens=call_data.get('input_tokens', 0),
+            output_tokens=call_data.get('output_tokens', 0),
+            total_tokens=call_data.get('total_tokens', 0),
+            estimated_cost=call_data.get('estimated_cost', 0.0),
+            response_time_ms=call_data.get('response_time_ms', 0),
+            success=call_data.get('success', True),
+            error_message=call_data.get('error_message'),
+            request_id=call_data.get('request_id')
+        ))
+        return None
+
+    def log_llm_call_nowait(self, record: LlmCallLog):
+        """
+        Synchronously queue an LLM call record for the batch writer
+
+        Must run on the event-loop thread (asyncio.Queue is not
+        thread-safe); worker threads should bounce through
+        loop.call_soon_threadsafe, as utils.tracking does.
+        """
+        if self._pool is None:
+            return
+
+        self._llm_log_queue.put_nowait((
+            record.provider,
+            record.model,
+            record.endpoint,
+            record.theme,
+            record.input_tokens,
+            record.output_tokens,
+            record.total_tokens,
+            record.estimated_cost,
+            record.response_time_ms,
+            record.success,
+            record.error_message,
+            record.request_id
+        ))
     
     async def create_pamphlet_record(self, pamphlet_data: Dict) -> Optional[int]:
         """
@@ -161,7 +274,7 @@ class DatabaseService:
         Returns:
             ID of inserted record, or None if failed
         """
-        if not self.is_enabled():
+        if self._pool is None:
             return None
         
         try:
@@ -185,23 +298,48 @@ class DatabaseService:
             
             pamphlet_id = await self._execute_insert(query, params)
             return pamphlet_id
-        except Exception as e:
-            print(f"⚠️  Failed to create pamphlet record: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            # logging handlers are queue-backed (see app.py), so the
+            # stack formatting happens off the event loop's back
+            logger.exception("Failed to create pamphlet record")
             return None
     
+    async def update_preview_path(self, pamphlet_id: int, preview_image_path: str) -> bool:
+        """
+        Set the preview image path on an existing pamphlet record
+
+        Used by the upload flow, which inserts the pamphlet record while
+        the preview image is still being saved.
+        """
+        if self._pool is None:
+            return False
+
+        try:
+            query = """
+                UPDATE pamphlets
+                SET preview_image_path = %s
+                WHERE id = %s AND deleted_at IS NULL
+            """
+            affected = await self._execute_update(query, (preview_image_path, pamphlet_id))
+            return affected > 0
+        except Exception as e:
+            print(f"⚠️  Failed to update preview path: {e}")
+            return False
+
     async def get_pamphlets(self, filters: Optional[Dict] = None) -> Tuple[List[Dict], int]:
         """
         Get list of pamphlets with filters and pagination
         
         Args:
-            filters: Dictionary with church_name, theme, limit, offset, sort, order
+            filters: Dictionary with church_name, theme, limit, offset, sort,
+                order, and optionally cursor_created_at/cursor_id for keyset
+                pagination (created_at DESC only)
             
         Returns:
-            Tuple of (pamphlets list, total count)
+            Tuple of (pamphlets list, total count; -1 when keyset paging
+            skips the count)
         """
-        if not self.is_enabled():
+        if self._pool is None:
             return [], 0
         
         filters = filters or {}
@@ -211,70 +349,109 @@ class DatabaseService:
         offset = filters.get('offset', 0)
         sort = filters.get('sort', 'created_at')
         order = filters.get('order', 'desc').upper()
-        
-        # Build WHERE clause
-        where_clauses = ["deleted_at IS NULL"]
+        cursor_created_at = filters.get('cursor_created_at')
+        cursor_id = filters.get('cursor_id')
+        include_total = filters.get('include_total', True)
+
+        # SQL injection prevention: parameterized queries, precompiled
+        # per filter combination
+        variant = (bool(church_name), bool(theme))
+        where_sql = _PAMPHLET_WHERE[variant]
         params = []
-        
-        # SQL injection prevention: Use parameterized queries
         if church_name:
-            where_clauses.append("church_name LIKE %s")
             params.append(f"%{church_name}%")
-        
         if theme:
-            where_clauses.append("theme LIKE %s")
             params.append(f"%{theme}%")
-        
-        where_sql = " AND ".join(where_clauses)
-        
+
         # Build ORDER BY
         valid_sort_fields = ['created_at', 'church_name', 'theme', 'file_size_bytes']
         sort_field = sort if sort in valid_sort_fields else 'created_at'
         order_clause = "ASC" if order == "ASC" else "DESC"
-        
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM pamphlets WHERE {where_sql}"
-        count_result = await self._execute_query(count_query, tuple(params))
-        total = count_result[0]['total'] if count_result else 0
-        
+
+        # Keyset pagination: resume strictly after the last row of the
+        # previous page, so the scan is O(limit) instead of re-reading
+        # OFFSET rows (served by idx_active_created). Only defined for
+        # the default created_at DESC ordering.
+        use_keyset = (
+            cursor_created_at is not None and cursor_id is not None
+            and sort_field == 'created_at' and order_clause == 'DESC'
+        )
+        count_params = tuple(params)
+        if use_keyset:
+            where_sql += " AND (created_at, id) < (%s, %s)"
+            params.extend([cursor_created_at, cursor_id])
+
+        if use_keyset or not include_total:
+            # Infinite-scroll pages don't need the total; skip the scan
+            total = -1
+        else:
+            count_result = await self._execute_query(_PAMPHLET_COUNT[variant], count_params)
+            total = count_result[0]['total'] if count_result else 0
+
         # Get paginated results
         # Simplified query - avoid complex subqueries that might cause connection issues
         # We don't select metadata JSON to avoid loading large JSON columns in memory
-        query = f"""
-            SELECT id, created_at, church_name, theme, file_path, file_name, 
-                   file_size_bytes, llm_call_id, preview_image_path
-            FROM pamphlets
-            WHERE {where_sql}
-            ORDER BY {sort_field} {order_clause}
-            LIMIT %s OFFSET %s
-        """
-        params.extend([limit, offset])
+        if use_keyset:
+            query = f"""
+                SELECT {_PAMPHLET_COLUMNS}
+                FROM pamphlets
+                WHERE {where_sql}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            """
+            params.append(limit)
+        else:
+            query = f"""
+                SELECT {_PAMPHLET_COLUMNS}
+                FROM pamphlets
+                WHERE {where_sql}
+                ORDER BY {sort_field} {order_clause}
+                LIMIT %s OFFSET %s
+            """
+            params.extend([limit, offset])
         
         results = await self._execute_query(query, tuple(params))
         
-        # Format results
+        # Format results. This loop runs once per row on every list
+        # request, so instance attributes are hoisted into locals, each
+        # URL is built with a single f-string, and the MB conversion is
+        # one multiply instead of two divides.
+        signed_secret = self._signed_url_secret
+        signed_ttl = self._signed_url_ttl
         pamphlets = []
+        append = pamphlets.append
         for row in results:
+            row_id = row['id']
+            created_at = row['created_at']
+            download_url = f'/api/pamphlets/{row_id}/download'
+            if signed_secret:
+                download_url += signed_url_suffix(
+                    signed_secret, row_id, row['file_path'], signed_ttl)
             pamphlet = {
-                'id': row['id'],
-                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+                'id': row_id,
+                'created_at': created_at.isoformat() if created_at else None,
                 'church_name': row['church_name'],
                 'theme': row['theme'],
                 'file_name': row['file_name'],
                 'file_size_bytes': row['file_size_bytes'],
-                'file_size_mb': round(row['file_size_bytes'] / 1024 / 1024, 2),
-                'download_url': f'/api/pamphlets/{row["id"]}/download'
+                'file_size_mb': round(row['file_size_bytes'] * _BYTES_TO_MB, 2),
+                'download_url': download_url
             }
             # Set preview_image_url from preview_image_path column (if available)
-            if row.get('preview_image_path'):
-                pamphlet['preview_image_url'] = f'/api/pamphlets/{row["id"]}/preview'
-            pamphlets.append(pamphlet)
-        
+            preview_path = row.get('preview_image_path')
+            if preview_path:
+                preview_url = f'/api/pamphlets/{row_id}/preview'
+                if signed_secret:
+                    preview_url += signed_url_suffix(
+                        signed_secret, row_id, preview_path, signed_ttl)
+                pamphlet['preview_image_url'] = preview_url
+            append(pamphlet)
+
         return pamphlets, total
     
     async def get_pamphlet_by_id(self, pamphlet_id: int) -> Optional[Dict]:
         """Get a single pamphlet by ID"""
-        if not self.is_enabled():
+        if self._pool is None:
             return None
         
         try:
@@ -302,9 +479,15 @@ class DatabaseService:
                 'download_url': f'/api/pamphlets/{row["id"]}/download',
                 'preview_image_path': row.get('preview_image_path')  # Include directly
             }
+            if self._signed_url_secret:
+                pamphlet['download_url'] += signed_url_suffix(
+                    self._signed_url_secret, row['id'], row['file_path'], self._signed_url_ttl)
             # Set preview_image_url from preview_image_path column (if available)
             if row.get('preview_image_path'):
                 pamphlet['preview_image_url'] = f'/api/pamphlets/{row["id"]}/preview'
+                if self._signed_url_secret:
+                    pamphlet['preview_image_url'] += signed_url_suffix(
+                        self._signed_url_secret, row['id'], row['preview_image_path'], self._signed_url_ttl)
             
             if row.get('metadata'):
                 try:
@@ -319,16 +502,18 @@ class DatabaseService:
     
     async def delete_pamphlet(self, pamphlet_id: int) -> bool:
         """Soft delete a pamphlet by setting deleted_at timestamp"""
-        if not self.is_enabled():
+        if self._pool is None:
             return False
         
         try:
+            # NOW(6) keeps the timestamp on the database's clock - one
+            # canonical timezone and one fewer bound parameter
             query = """
                 UPDATE pamphlets
-                SET deleted_at = %s
+                SET deleted_at = NOW(6)
                 WHERE id = %s AND deleted_at IS NULL
             """
-            affected = await self._execute_update(query, (datetime.now(), pamphlet_id))
+            affected = await self._execute_update(query, (pamphlet_id,))
             return affected > 0
         except Exception as e:
             print(f"⚠️  Failed to delete pamphlet: {e}")
@@ -348,7 +533,7 @@ class DatabaseService:
         Returns:
             Dictionary with usage statistics
         """
-        if not self.is_enabled():
+        if self._pool is None:
             return {}
         
         try:
@@ -370,58 +555,52 @@ class DatabaseService:
             
             where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
             
-            # Get overall stats
-            overall_query = f"""
-                SELECT 
-                    COUNT(*) as total_calls,
-                    SUM(total_tokens) as total_tokens,
-                    SUM(estimated_cost) as total_cost
-                FROM llm_api_calls
-                WHERE {where_sql}
-            """
-            overall_result = await self._execute_query(overall_query, tuple(params))
-            overall = overall_result[0] if overall_result else {}
-            
-            # Get stats by provider
-            provider_query = f"""
+            # One scan instead of three: WITH ROLLUP appends per-provider
+            # subtotal rows (endpoint NULL) and a grand-total row
+            # (provider NULL); the per-endpoint view is folded client-side
+            # from the detail rows. provider/endpoint are NOT NULL columns,
+            # so NULL unambiguously marks rollup rows.
+            query = f"""
                 SELECT 
                     provider,
+                    endpoint,
                     COUNT(*) as calls,
                     SUM(total_tokens) as tokens,
                     SUM(estimated_cost) as cost
                 FROM llm_api_calls
                 WHERE {where_sql}
-                GROUP BY provider
-            """
-            provider_results = await self._execute_query(provider_query, tuple(params))
-            by_provider = {row['provider']: {
-                'calls': row['calls'],
-                'tokens': row['tokens'] or 0,
-                'cost': float(row['cost'] or 0)
-            } for row in provider_results}
-            
-            # Get stats by endpoint
-            endpoint_query = f"""
-                SELECT 
-                    endpoint,
-                    COUNT(*) as calls,
-                    AVG(total_tokens) as avg_tokens,
-                    AVG(estimated_cost) as avg_cost
-                FROM llm_api_calls
-                WHERE {where_sql}
-                GROUP BY endpoint
+                GROUP BY provider, endpoint WITH ROLLUP
             """
-            endpoint_results = await self._execute_query(endpoint_query, tuple(params))
-            by_endpoint = {row['endpoint']: {
-                'calls': row['calls'],
-                'avg_tokens': round(float(row['avg_tokens'] or 0)),
-                'avg_cost': round(float(row['avg_cost'] or 0), 6)
-            } for row in endpoint_results}
+            rows = await self._execute_query(query, tuple(params))
+
+            overall = {}
+            by_provider = {}
+            endpoint_acc = {}
+            for row in rows:
+                if row['provider'] is None:
+                    overall = row
+                elif row['endpoint'] is None:
+                    by_provider[row['provider']] = {
+                        'calls': row['calls'],
+                        'tokens': row['tokens'] or 0,
+                        'cost': float(row['cost'] or 0)
+                    }
+                else:
+                    acc = endpoint_acc.setdefault(row['endpoint'], [0, 0, 0.0])
+                    acc[0] += row['calls']
+                    acc[1] += row['tokens'] or 0
+                    acc[2] += float(row['cost'] or 0)
+
+            by_endpoint = {endpoint: {
+                'calls': calls,
+                'avg_tokens': round(tokens / calls) if calls else 0,
+                'avg_cost': round(cost / calls, 6) if calls else 0.0
+            } for endpoint, (calls, tokens, cost) in endpoint_acc.items()}
             
             return {
-                'total_calls': overall.get('total_calls', 0) or 0,
-                'total_tokens': overall.get('total_tokens', 0) or 0,
-                'total_cost_usd': round(float(overall.get('total_cost', 0) or 0), 6),
+                'total_calls': overall.get('calls', 0) or 0,
+                'total_tokens': overall.get('tokens', 0) or 0,
+                'total_cost_usd': round(float(overall.get('cost', 0) or 0), 6),
                 'by_provider': by_provider,
                 'by_endpoint': by_endpoint
             }
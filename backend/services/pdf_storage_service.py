@@ -4,45 +4,97 @@ Handles async file operations for saving and retrieving PDFs
 """
 
 import os
+import re
+import time
 import asyncio
+import secrets
 import aiofiles
-from datetime import datetime
 from typing import Tuple, Optional
 from pathlib import Path
 
+from config import Config, get_config
+
+# Chunk size for streaming copies in save_pdf
+_COPY_CHUNK = 262144  # 256 KB
+
+# Filename sanitizer: '..' sequences and anything outside
+# [alphanumeric, underscore, space, dot, dash] become '-' in one
+# C-level substitution pass
+_SANITIZE_RE = re.compile(r'\.\.|[^\w .\-]')
+
 
 class PDFStorageService:
     """
     Async PDF storage service for local filesystem
-    
-    Environment variables:
-    - PDF_STORAGE_DIR (default: pdfs) - Relative to backend directory
-    - PDF_STORAGE_PATH (optional) - Full path to storage directory
+
+    The storage directory comes from the shared Config snapshot
+    (PDF_STORAGE_PATH, or PDF_STORAGE_DIR relative to backend/); pass
+    a Config explicitly to override it.
     """
-    
-    def __init__(self):
-        # Determine storage directory
-        storage_dir = os.getenv('PDF_STORAGE_DIR', 'pdfs')
-        storage_path = os.getenv('PDF_STORAGE_PATH')
-        
-        if storage_path:
-            self.storage_path = Path(storage_path)
-        else:
-            # Relative to backend directory
-            backend_dir = Path(__file__).parent.parent
-            self.storage_path = backend_dir / storage_dir
-        
+
+    def __init__(self, cfg: Optional[Config] = None):
+        cfg = cfg or get_config()
+        self.storage_path = cfg.resolved_storage_path()
+
         # Ensure storage directory exists
         self.storage_path.mkdir(parents=True, exist_ok=True)
+
+        # Normalized root for pure-Python traversal checks in _resolve
+        self._storage_root = os.path.normpath(str(self.storage_path))
+
+        # Short-TTL cache of resolved file paths. get_file_path runs on
+        # every download/preview hit, so caching successful resolutions
+        # skips the exists() syscall + executor bounce for warm files.
+        self._path_cache = {}
+        self._path_cache_ttl = 60  # seconds
+        self._path_cache_max = 4096
+
+        # Church directories already created this process; saves for a
+        # known church skip the mkdir syscall round trip entirely
+        self._known_dirs = set()
+
         print(f"✅ PDF storage initialized: {self.storage_path}")
     
+    @staticmethod
+    def _write_file_blocking(file_path, data: bytes, make_parents: bool = False):
+        """
+        Write a file in one blocking call (mkdir + open + write + close)
+
+        Doing the whole sequence in a single thread-pool hop keeps the
+        per-file overhead to one executor round-trip instead of one per
+        open/write/close like chunked aiofiles writes.
+        """
+        if make_parents:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    async def write_file(self, file_path, data: bytes, make_parents: bool = False):
+        """Write bytes to a file asynchronously in a single executor hop"""
+        await asyncio.to_thread(self._write_file_blocking, file_path, data, make_parents)
+
+    @staticmethod
+    def _copy_stream_blocking(read, file_path):
+        """
+        Copy a file-like source to file_path in fixed-size chunks
+
+        Keeps memory constant regardless of PDF size (one chunk buffered
+        at a time instead of the whole file), in a single thread-pool
+        hop like _write_file_blocking.
+        """
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while chunk := read(_COPY_CHUNK):
+                os.write(fd, chunk)
+        finally:
+            os.close(fd)
+
     def _sanitize_filename(self, name: str) -> str:
         """Sanitize filename to prevent directory traversal"""
-        # Remove path separators and dangerous characters
-        sanitized = name.replace('/', '-').replace('\\', '-').replace('..', '-')
-        # Remove other potentially dangerous characters
-        sanitized = ''.join(c for c in sanitized if c.isalnum() or c in (' ', '-', '_', '.'))
-        return sanitized.strip()
+        return _SANITIZE_RE.sub('-', name).strip()
     
     async def save_pdf(self, pdf_file, metadata: dict = None) -> Tuple[str, str]:
         """
@@ -67,29 +119,36 @@ class PDFStorageService:
             church_dir = self._sanitize_filename(church_name.lower())
             theme_name = self._sanitize_filename(theme.lower())
             
-            # Create church directory
+            # Create church directory (once per directory per process)
             church_path = self.storage_path / church_dir
-            await asyncio.to_thread(church_path.mkdir, parents=True, exist_ok=True)
+            if church_path not in self._known_dirs:
+                await asyncio.to_thread(church_path.mkdir, parents=True, exist_ok=True)
+                self._known_dirs.add(church_path)
             
-            # Generate filename with timestamp
-            timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-            file_name = f"{theme_name}-{timestamp}.pdf"
+            # Generate filename: unix timestamp keeps names sortable and
+            # the random suffix prevents two same-second uploads for one
+            # church+theme from silently overwriting each other
+            suffix = f"{int(time.time())}-{secrets.token_hex(3)}"
+            file_name = f"{theme_name}-{suffix}.pdf"
             
             # Full file path
             file_path = church_path / file_name
             
-            # Read file content
-            if hasattr(pdf_file, 'read'):
-                # FileStorage object
+            # Write the content: bytes go out in one hop, file-like and
+            # path sources are streamed chunk by chunk so a large upload
+            # never sits fully buffered in memory
+            if isinstance(pdf_file, bytes):
+                await self.write_file(file_path, pdf_file)
+            elif hasattr(pdf_file, 'read'):
+                # FileStorage / file-like object
                 pdf_file.seek(0)
-                content = pdf_file.read()
+                await asyncio.to_thread(self._copy_stream_blocking, pdf_file.read, file_path)
             else:
-                # Already bytes or file path
-                content = pdf_file if isinstance(pdf_file, bytes) else await aiofiles.open(pdf_file, 'rb').read()
-            
-            # Write file asynchronously
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
+                # Path to an existing file
+                def _copy_path():
+                    with open(pdf_file, 'rb') as src:
+                        self._copy_stream_blocking(src.read, file_path)
+                await asyncio.to_thread(_copy_path)
             
             # Return relative path from storage root and filename
             relative_path = f"{church_dir}/{file_name}"
@@ -98,6 +157,23 @@ class PDFStorageService:
         except Exception as e:
             raise Exception(f"Failed to save PDF: {str(e)}")
     
+    def _resolve(self, relative_path: str) -> Optional[Path]:
+        """
+        Validate a relative path and map it to a full Path — no syscalls
+
+        Traversal checks use os.path.normpath plus a prefix compare
+        instead of Path.resolve(), so callers can go straight to the
+        read/stat/unlink and handle FileNotFoundError there rather than
+        paying an exists() round trip first.
+        """
+        if '..' in relative_path or '/' not in relative_path:
+            return None
+        full_path = self.storage_path / relative_path
+        normalized = os.path.normpath(str(full_path))
+        if not normalized.startswith(self._storage_root + os.sep):
+            return None
+        return full_path
+
     async def get_file_path(self, relative_path: str) -> Optional[Path]:
         """
         Get full file path from relative path
@@ -109,53 +185,86 @@ class PDFStorageService:
             Full Path object, or None if invalid
         """
         try:
-            # Prevent directory traversal
-            if '..' in relative_path or '/' not in relative_path:
-                return None
-            
-            full_path = self.storage_path / relative_path
-            
-            # Ensure path is within storage directory
-            if not str(full_path.resolve()).startswith(str(self.storage_path.resolve())):
+            # Serve recently-resolved paths from cache
+            cached = self._path_cache.get(relative_path)
+            if cached is not None:
+                path, expires = cached
+                if expires > time.monotonic():
+                    return path
+                del self._path_cache[relative_path]
+
+            full_path = self._resolve(relative_path)
+            if full_path is None:
                 return None
-            
+
             # Check if file exists
             if not await asyncio.to_thread(full_path.exists):
                 return None
             
+            # Only successful resolutions are cached, so a deleted file is
+            # rediscovered after at most one TTL
+            if len(self._path_cache) >= self._path_cache_max:
+                self._path_cache.clear()
+            self._path_cache[relative_path] = (full_path, time.monotonic() + self._path_cache_ttl)
+
             return full_path
         except Exception as e:
             print(f"⚠️  Failed to get file path: {e}")
             return None
     
     async def get_file_size(self, relative_path: str) -> Optional[int]:
-        """Get file size in bytes"""
-        file_path = await self.get_file_path(relative_path)
-        if file_path:
-            def _get_size(p: Path) -> int:
-                return p.stat().st_size
-            return await asyncio.to_thread(_get_size, file_path)
-        return None
-    
+        """Get file size in bytes (single stat, no exists pre-check)"""
+        file_path = self._resolve(relative_path)
+        if file_path is None:
+            return None
+        try:
+            stat = await asyncio.to_thread(os.stat, file_path)
+            return stat.st_size
+        except OSError:
+            return None
+
     async def delete_file(self, relative_path: str) -> bool:
-        """Delete a PDF file"""
+        """Delete a PDF file (single unlink, no exists pre-check)"""
+        file_path = self._resolve(relative_path)
+        if file_path is None:
+            return False
         try:
-            file_path = await self.get_file_path(relative_path)
-            if file_path:
-                await asyncio.to_thread(file_path.unlink)
-                return True
+            await asyncio.to_thread(os.unlink, file_path)
+            self._path_cache.pop(relative_path, None)
+            return True
+        except FileNotFoundError:
             return False
-        except Exception as e:
+        except OSError as e:
             print(f"⚠️  Failed to delete file: {e}")
             return False
-    
+
+    async def open_file(self, relative_path: str):
+        """
+        Open a PDF for streaming and return the aiofiles handle
+
+        For serving downloads prefer the FileResponse/X-Accel-Redirect
+        paths in app.py, which splice file to socket via sendfile(2);
+        this is for callers that need to stream chunks through Python
+        without buffering the whole file like read_file does. Returns
+        None for invalid or missing paths; the caller closes the handle.
+        """
+        file_path = self._resolve(relative_path)
+        if file_path is None:
+            return None
+        try:
+            return await aiofiles.open(file_path, 'rb')
+        except FileNotFoundError:
+            return None
+
     async def read_file(self, relative_path: str) -> Optional[bytes]:
-        """Read PDF file content"""
+        """Read PDF file content (open directly, no exists pre-check)"""
+        file_path = self._resolve(relative_path)
+        if file_path is None:
+            return None
         try:
-            file_path = await self.get_file_path(relative_path)
-            if file_path:
-                async with aiofiles.open(file_path, 'rb') as f:
-                    return await f.read()
+            async with aiofiles.open(file_path, 'rb') as f:
+                return await f.read()
+        except FileNotFoundError:
             return None
         except Exception as e:
             print(f"⚠️  Failed to read file: {e}")
@@ -3,6 +3,9 @@ Cost Calculator for LLM API calls
 Provides token cost calculations based on provider and model
 """
 
+from functools import lru_cache
+from typing import Optional, Tuple
+
 # Provider-specific token costs (per 1M tokens)
 # Prices are approximate and may vary - update as needed
 COSTS = {
@@ -24,6 +27,54 @@ COSTS = {
 }
 
 
+# Lowercased lookup index frozen at import: exact model hits resolve in
+# one dict lookup, the substring tier keeps pre-lowered keys, and the
+# fallback (first listed model) is precomputed per provider
+_COSTS_LOWER = {
+    provider_l.lower(): {
+        'exact': {
+            model.lower(): (pricing['input'], pricing['output'])
+            for model, pricing in models.items()
+        },
+        'substrings': [
+            (model.lower(), (pricing['input'], pricing['output']))
+            for model, pricing in models.items()
+        ],
+        'default': next(
+            ((p['input'], p['output']) for p in models.values()), None
+        ),
+    }
+    for provider_l, models in COSTS.items()
+}
+
+
+@lru_cache(maxsize=256)
+def _resolve_pricing(provider: str, model: str) -> Optional[Tuple[float, float]]:
+    """
+    Resolve (input, output) pricing per 1M tokens for a provider/model
+
+    The fuzzy substring match runs at most once per (provider, model)
+    pair for the process lifetime; calculate_cost sits on the LLM
+    tracking hot path and only does arithmetic on the cached tuple.
+    """
+    entry = _COSTS_LOWER.get(provider.lower())
+    if entry is None:
+        return None
+    
+    model_lower = model.lower()
+    
+    pricing = entry['exact'].get(model_lower)
+    if pricing is not None:
+        return pricing
+    
+    # Fuzzy match, then first listed model as fallback
+    for cost_model, pricing in entry['substrings']:
+        if cost_model in model_lower or model_lower in cost_model:
+            return pricing
+    
+    return entry['default']
+
+
 def calculate_cost(provider: str, model: str, input_tokens: int, output_tokens: int) -> float:
     """
     Calculate estimated cost for LLM API call
@@ -37,33 +88,11 @@ def calculate_cost(provider: str, model: str, input_tokens: int, output_tokens:
     Returns:
         Estimated cost in USD
     """
-    provider_lower = provider.lower()
-    model_lower = model.lower()
-    
-    # Find matching provider
-    if provider_lower not in COSTS:
+    pricing = _resolve_pricing(provider, model)
+    if pricing is None:
         return 0.0
     
-    provider_costs = COSTS[provider_lower]
-    
-    # Find matching model (fuzzy match)
-    model_pricing = None
-    for cost_model, pricing in provider_costs.items():
-        if cost_model.lower() in model_lower or model_lower in cost_model.lower():
-            model_pricing = pricing
-            break
-    
-    # If no exact match, use first available model as fallback
-    if model_pricing is None and provider_costs:
-        model_pricing = list(provider_costs.values())[0]
-    
-    if model_pricing is None:
-        return 0.0
-    
-    # Calculate cost
-    input_cost = (input_tokens / 1_000_000) * model_pricing['input']
-    output_cost = (output_tokens / 1_000_000) * model_pricing['output']
-    
-    return round(input_cost + output_cost, 6)
+    input_price, output_price = pricing
+    return round(input_tokens * input_price * 1e-6 + output_tokens * output_price * 1e-6, 6)
 
 
@@ -7,6 +7,8 @@ import os
 import sys
 from typing import List, Tuple, Optional
 
+from config import get_config
+
 
 class EnvValidationError(Exception):
     """Raised when environment validation fails"""
@@ -45,10 +47,11 @@ def validate_required_env_vars() -> Tuple[bool, List[str], List[str]]:
         if not os.getenv('GOOGLE_API_KEY'):
             errors.append("GOOGLE_API_KEY is required when AI_PROVIDER=gemini")
     
-    # Database configuration (optional but recommended)
-    mysql_user = os.getenv('MYSQL_USER')
-    mysql_password = os.getenv('MYSQL_PASSWORD')
-    if not mysql_user or not mysql_password:
+    # Database configuration (optional but recommended). Building the
+    # shared Config here also primes the cache the services reuse, so
+    # these variables are only read from the environment once.
+    cfg = get_config()
+    if not cfg.mysql_user or not cfg.mysql_password:
         warnings.append("MYSQL_USER and MYSQL_PASSWORD not set. Database features will be disabled.")
     
     # Production-specific validations
@@ -69,15 +72,13 @@ def validate_required_env_vars() -> Tuple[bool, List[str], List[str]]:
             warnings.append("WORKERS not set. Using default. Consider setting based on CPU cores.")
     
     # PDF storage path validation
-    pdf_storage_path = os.getenv('PDF_STORAGE_PATH')
-    if pdf_storage_path:
-        from pathlib import Path
-        storage_path = Path(pdf_storage_path)
+    if cfg.pdf_storage_path:
+        storage_path = cfg.resolved_storage_path()
         if not storage_path.exists():
             try:
                 storage_path.mkdir(parents=True, exist_ok=True)
             except Exception as e:
-                errors.append(f"Cannot create PDF_STORAGE_PATH '{pdf_storage_path}': {e}")
+                errors.append(f"Cannot create PDF_STORAGE_PATH '{cfg.pdf_storage_path}': {e}")
     
     return len(errors) == 0, errors, warnings
 
@@ -86,6 +87,8 @@ def validate_and_exit_on_error():
     """
     Validate environment variables and exit if critical errors found
     Prints warnings but continues if only warnings
+
+    Returns the shared Config built during validation.
     """
     is_valid, errors, warnings = validate_required_env_vars()
     
@@ -110,6 +113,6 @@ def validate_and_exit_on_error():
         print("✅ Environment configuration validated successfully")
     elif is_valid:
         print("✅ Environment configuration validated (with warnings)")
-    
-    return is_valid
+
+    return get_config()
 
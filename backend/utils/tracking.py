@@ -4,16 +4,96 @@ Tracks LLM calls with token usage, costs, and performance metrics
 """
 
 from functools import wraps
+import inspect
+from collections import namedtuple
+from dataclasses import dataclass
+import os
 import time
-import uuid
+import atexit
 import asyncio
 import threading
 from typing import Callable, Optional
 
+
+@dataclass(slots=True)
+class LlmCallLog:
+    """
+    One LLM call's telemetry row
+
+    Slots instead of a 12-key dict per call: no per-instance __dict__,
+    and the batch writer reads fields with C-level slot lookups.
+    """
+    provider: str
+    model: str
+    endpoint: str
+    theme: Optional[str]
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    estimated_cost: float
+    response_time_ms: int
+    success: bool
+    request_id: str
+    error_message: Optional[str] = None
+
+
 # Store reference to the main event loop for thread-safe logging
 _main_event_loop: Optional[asyncio.AbstractEventLoop] = None
 _main_event_loop_lock = threading.Lock()
 
+# Persistent fallback loop for logging when no main loop is registered:
+# one daemon thread per process instead of a fresh thread plus event
+# loop per log record
+_fallback_loop: Optional[asyncio.AbstractEventLoop] = None
+_fallback_loop_lock = threading.Lock()
+
+
+def _get_fallback_loop() -> asyncio.AbstractEventLoop:
+    """Lazily start the shared fallback event loop on a daemon thread"""
+    global _fallback_loop
+    if _fallback_loop is None:
+        with _fallback_loop_lock:
+            if _fallback_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever,
+                    name='llm-log-fallback', daemon=True).start()
+                atexit.register(lambda: loop.call_soon_threadsafe(loop.stop))
+                _fallback_loop = loop
+    return _fallback_loop
+
+# App-level singletons resolved once on the first tracked call (they
+# can't be imported at module load without a circular import); after
+# that every call is a single global read instead of repeated
+# sys.modules lookups
+_Deps = namedtuple('_Deps', ['database_service', 'ai_service', 'calculate_cost'])
+_deps: Optional[_Deps] = None
+
+
+def _resolve_deps() -> _Deps:
+    """Resolve the app singletons and cache them for subsequent calls"""
+    global _deps
+    from app import database_service, ai_service
+    from utils.cost_calculator import calculate_cost
+    _deps = _Deps(database_service, ai_service, calculate_cost)
+    return _deps
+
+
+# Lowercased provider name and model rarely change at runtime; memoize
+# them keyed on the AIService instance identity so a provider swap
+# (new instance) invalidates the cache naturally
+_provider_cache = {'service': None, 'provider': 'unknown', 'model': 'unknown'}
+
+
+def _provider_info(ai_service) -> tuple:
+    """(provider, model) for the current AIService, cached per instance"""
+    cache = _provider_cache
+    if cache['service'] is not ai_service:
+        cache['provider'] = ai_service.provider_name.lower()
+        cache['model'] = getattr(ai_service._service, 'model', 'unknown')
+        cache['service'] = ai_service
+    return cache['provider'], cache['model']
+
 
 def set_main_event_loop(loop: asyncio.AbstractEventLoop):
     """Set the main event loop for thread-safe async logging"""
@@ -31,33 +111,118 @@ def _schedule_logging_task(coro):
     - If in thread without loop: asyncio.run_coroutine_threadsafe() on main loop
     - If no main loop: runs in background thread with new event loop
     """
-    try:
-        # Try to get the current running event loop
-        loop = asyncio.get_running_loop()
+    # _get_running_loop returns None instead of raising, so the common
+    # sync-context probe doesn't build and unwind a RuntimeError per call
+    if asyncio._get_running_loop() is not None:
         # We're in an async context, use create_task
         asyncio.create_task(coro)
-    except RuntimeError:
-        # No running event loop - we're likely in a thread
-        with _main_event_loop_lock:
-            main_loop = _main_event_loop
-        
-        if main_loop and main_loop.is_running():
-            # Use thread-safe scheduling on the main event loop
-            asyncio.run_coroutine_threadsafe(coro, main_loop)
+        return
+
+    # No running event loop - we're likely in a thread
+    with _main_event_loop_lock:
+        main_loop = _main_event_loop
+
+    if main_loop and main_loop.is_running():
+        # Use thread-safe scheduling on the main event loop
+        asyncio.run_coroutine_threadsafe(coro, main_loop)
+    else:
+        # No main loop available - use the shared fallback loop
+        asyncio.run_coroutine_threadsafe(coro, _get_fallback_loop())
+
+
+def _extract_usage(result) -> tuple:
+    """
+    (input_tokens, output_tokens, total_tokens) from a provider result
+
+    Duck-typed on .get rather than isinstance: mapping results carry a
+    nested 'usage' dict or flat token fields, SDK response objects
+    expose a .usage attribute, and anything else counts as zero usage.
+    """
+    get = getattr(result, 'get', None)
+    if get is not None:
+        usage = get('usage')
+        if usage is not None:
+            input_tokens = usage.get('prompt_tokens', 0) or usage.get('input_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0) or usage.get('output_tokens', 0)
+            total_tokens = usage.get('total_tokens', 0) or (input_tokens + output_tokens)
         else:
-            # No main loop available - run in background thread with new event loop
-            def run_in_thread():
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(coro)
-                    loop.close()
-                except Exception:
-                    # Silently ignore errors in background logging
-                    pass
-            
-            thread = threading.Thread(target=run_in_thread, daemon=True)
-            thread.start()
+            input_tokens = get('input_tokens', 0)
+            output_tokens = get('output_tokens', 0)
+            total_tokens = get('total_tokens', 0) or (input_tokens + output_tokens)
+        return input_tokens, output_tokens, total_tokens
+
+    # SDK / pydantic response objects with a usage attribute
+    usage = getattr(result, 'usage', None)
+    if usage is not None:
+        input_tokens = getattr(usage, 'prompt_tokens', 0) or getattr(usage, 'input_tokens', 0) or 0
+        output_tokens = getattr(usage, 'completion_tokens', 0) or getattr(usage, 'output_tokens', 0) or 0
+        total_tokens = getattr(usage, 'total_tokens', 0) or (input_tokens + output_tokens)
+        return input_tokens, output_tokens, total_tokens
+    return 0, 0, 0
+
+
+# TRACK_ZERO_TOKEN_CALLS=0 skips the log write for successful calls
+# that report no usage (cache hits, short-circuit paths), trimming log
+# volume. Read lazily so the .env loaded in app.py applies; default is
+# to keep logging everything.
+_skip_zero_token: Optional[bool] = None
+
+
+def _should_skip_zero_token() -> bool:
+    global _skip_zero_token
+    if _skip_zero_token is None:
+        _skip_zero_token = os.getenv(
+            'TRACK_ZERO_TOKEN_CALLS', '1').lower() in ('0', 'false', 'no')
+    return _skip_zero_token
+
+
+def _extract_theme(args, kwargs, index: Optional[int]) -> Optional[str]:
+    """
+    Theme for the log row: the keyword arg, else the positional at the
+    signature-derived index
+
+    The index comes from the decorated function's signature (resolved
+    once at decoration time), so methods whose theme is not the first
+    argument - generate_coloring_image(self, prompt, theme) - log the
+    actual theme rather than whichever string happens to come first.
+    """
+    theme = kwargs.get('theme')
+    if theme is not None:
+        return theme
+    if index is not None and index < len(args):
+        theme = args[index]
+        if isinstance(theme, str):
+            return theme
+    return None
+
+
+async def _put_record(database_service, payload: 'LlmCallLog'):
+    """Coroutine shim so the fallback loop can run the sync enqueue"""
+    database_service.log_llm_call_nowait(payload)
+
+
+def _enqueue_log(database_service, payload: 'LlmCallLog'):
+    """
+    Hand a log record to the database batch writer without allocating a
+    coroutine or task
+
+    On the event-loop thread this is a direct put_nowait; from worker
+    threads (sync providers under asyncio.to_thread) the enqueue bounces
+    through call_soon_threadsafe because asyncio.Queue is not
+    thread-safe. Only when no loop exists at all does it fall back to
+    the coroutine-scheduling path.
+    """
+    if asyncio._get_running_loop() is not None:
+        database_service.log_llm_call_nowait(payload)
+        return
+
+    with _main_event_loop_lock:
+        main_loop = _main_event_loop
+    if main_loop and main_loop.is_running():
+        main_loop.call_soon_threadsafe(
+            database_service.log_llm_call_nowait, payload)
+    else:
+        _schedule_logging_task(_put_record(database_service, payload))
 
 
 def track_llm_call(endpoint_name: str):
@@ -71,161 +236,142 @@ def track_llm_call(endpoint_name: str):
         endpoint_name: Name of the endpoint/method being tracked
     """
     def decorator(func: Callable):
+        # Positional index of the theme argument, resolved once here.
+        # func is the unbound function, so 'self' occupies slot 0 and
+        # the index lines up with the wrapper's args tuple.
+        try:
+            theme_index = list(inspect.signature(func).parameters).index('theme')
+        except ValueError:
+            theme_index = None
+
         if asyncio.iscoroutinefunction(func):
             # Async function
             @wraps(func)
             async def async_wrapper(*args, **kwargs):
-                start_time = time.time()
-                request_id = str(uuid.uuid4())
-                
-                # Import here to avoid circular imports
-                # Import instances from app module (created in app.py)
-                from app import database_service, ai_service
-                from utils.cost_calculator import calculate_cost
+                start_ns = time.perf_counter_ns()
+                request_id = os.urandom(16).hex()
+                theme = _extract_theme(args, kwargs, theme_index)
                 
-                provider_name = ai_service.provider_name.lower()
-                model_name = getattr(ai_service._service, 'model', 'unknown')
+                deps = _deps or _resolve_deps()
+                database_service = deps.database_service
+                ai_service = deps.ai_service
+                calculate_cost = deps.calculate_cost
+
+                provider_name, model_name = _provider_info(ai_service)
                 
                 try:
                     result = await func(*args, **kwargs)
-                    response_time = int((time.time() - start_time) * 1000)
-                    
-                    # Extract token usage from result
-                    # Result may be a dict with 'usage' key or separate token fields
-                    input_tokens = 0
-                    output_tokens = 0
-                    total_tokens = 0
+                    response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
                     
-                    if isinstance(result, dict):
-                        if 'usage' in result:
-                            usage = result['usage']
-                            input_tokens = usage.get('prompt_tokens', 0) or usage.get('input_tokens', 0)
-                            output_tokens = usage.get('completion_tokens', 0) or usage.get('output_tokens', 0)
-                            total_tokens = usage.get('total_tokens', 0) or (input_tokens + output_tokens)
-                        else:
-                            input_tokens = result.get('input_tokens', 0)
-                            output_tokens = result.get('output_tokens', 0)
-                            total_tokens = result.get('total_tokens', 0) or (input_tokens + output_tokens)
+                    input_tokens, output_tokens, total_tokens = _extract_usage(result)
+
+                    # Nothing billed, nothing failed - optionally skip the write
+                    if total_tokens == 0 and _should_skip_zero_token():
+                        return result
                     
                     # Calculate cost
                     estimated_cost = calculate_cost(provider_name, model_name, input_tokens, output_tokens)
                     
-                    # Extract theme if available
-                    theme = kwargs.get('theme') or (args[0] if args else None)
-                    
                     # Log to database (fire-and-forget)
-                    asyncio.create_task(database_service.log_llm_call({
-                        'provider': provider_name,
-                        'model': model_name,
-                        'endpoint': endpoint_name,
-                        'theme': theme,
-                        'input_tokens': input_tokens,
-                        'output_tokens': output_tokens,
-                        'total_tokens': total_tokens,
-                        'estimated_cost': estimated_cost,
-                        'response_time_ms': response_time,
-                        'success': True,
-                        'request_id': request_id
-                    }))
+                    database_service.log_llm_call_nowait(LlmCallLog(
+                        provider=provider_name,
+                        model=model_name,
+                        endpoint=endpoint_name,
+                        theme=theme,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        total_tokens=total_tokens,
+                        estimated_cost=estimated_cost,
+                        response_time_ms=response_time,
+                        success=True,
+                        request_id=request_id
+                    ))
                     
                     return result
                 except Exception as e:
-                    response_time = int((time.time() - start_time) * 1000)
+                    response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
                     
                     # Log error (fire-and-forget)
-                    asyncio.create_task(database_service.log_llm_call({
-                        'provider': provider_name,
-                        'model': model_name,
-                        'endpoint': endpoint_name,
-                        'theme': kwargs.get('theme') or (args[0] if args else None),
-                        'input_tokens': 0,
-                        'output_tokens': 0,
-                        'total_tokens': 0,
-                        'estimated_cost': 0.0,
-                        'response_time_ms': response_time,
-                        'success': False,
-                        'error_message': str(e),
-                        'request_id': request_id
-                    }))
+                    database_service.log_llm_call_nowait(LlmCallLog(
+                        provider=provider_name,
+                        model=model_name,
+                        endpoint=endpoint_name,
+                        theme=theme,
+                        input_tokens=0,
+                        output_tokens=0,
+                        total_tokens=0,
+                        estimated_cost=0.0,
+                        response_time_ms=response_time,
+                        success=False,
+                        error_message=str(e),
+                        request_id=request_id
+                    ))
                     raise
             return async_wrapper
         else:
             # Sync function
             @wraps(func)
             def sync_wrapper(*args, **kwargs):
-                start_time = time.time()
-                request_id = str(uuid.uuid4())
-                
-                # Import here to avoid circular imports
-                # Import instances from app module (created in app.py)
-                from app import database_service, ai_service
-                from utils.cost_calculator import calculate_cost
+                start_ns = time.perf_counter_ns()
+                request_id = os.urandom(16).hex()
+                theme = _extract_theme(args, kwargs, theme_index)
                 
-                provider_name = ai_service.provider_name.lower()
-                model_name = getattr(ai_service._service, 'model', 'unknown')
+                deps = _deps or _resolve_deps()
+                database_service = deps.database_service
+                ai_service = deps.ai_service
+                calculate_cost = deps.calculate_cost
+
+                provider_name, model_name = _provider_info(ai_service)
                 
                 try:
                     result = func(*args, **kwargs)
-                    response_time = int((time.time() - start_time) * 1000)
+                    response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
                     
-                    # Extract token usage (same logic as async)
-                    input_tokens = 0
-                    output_tokens = 0
-                    total_tokens = 0
-                    
-                    if isinstance(result, dict):
-                        if 'usage' in result:
-                            usage = result['usage']
-                            input_tokens = usage.get('prompt_tokens', 0) or usage.get('input_tokens', 0)
-                            output_tokens = usage.get('completion_tokens', 0) or usage.get('output_tokens', 0)
-                            total_tokens = usage.get('total_tokens', 0) or (input_tokens + output_tokens)
-                        else:
-                            input_tokens = result.get('input_tokens', 0)
-                            output_tokens = result.get('output_tokens', 0)
-                            total_tokens = result.get('total_tokens', 0) or (input_tokens + output_tokens)
+                    input_tokens, output_tokens, total_tokens = _extract_usage(result)
+
+                    # Nothing billed, nothing failed - optionally skip the write
+                    if total_tokens == 0 and _should_skip_zero_token():
+                        return result
                     
                     # Calculate cost
                     estimated_cost = calculate_cost(provider_name, model_name, input_tokens, output_tokens)
                     
-                    # Extract theme
-                    theme = kwargs.get('theme') or (args[0] if args else None)
-                    
                     # Log to database (fire-and-forget, async)
                     # Use thread-safe scheduling that works from any context
-                    _schedule_logging_task(database_service.log_llm_call({
-                        'provider': provider_name,
-                        'model': model_name,
-                        'endpoint': endpoint_name,
-                        'theme': theme,
-                        'input_tokens': input_tokens,
-                        'output_tokens': output_tokens,
-                        'total_tokens': total_tokens,
-                        'estimated_cost': estimated_cost,
-                        'response_time_ms': response_time,
-                        'success': True,
-                        'request_id': request_id
-                    }))
+                    _enqueue_log(database_service, LlmCallLog(
+                        provider=provider_name,
+                        model=model_name,
+                        endpoint=endpoint_name,
+                        theme=theme,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        total_tokens=total_tokens,
+                        estimated_cost=estimated_cost,
+                        response_time_ms=response_time,
+                        success=True,
+                        request_id=request_id
+                    ))
                     
                     return result
                 except Exception as e:
-                    response_time = int((time.time() - start_time) * 1000)
+                    response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
                     
                     # Log error (fire-and-forget)
                     # Use thread-safe scheduling that works from any context
-                    _schedule_logging_task(database_service.log_llm_call({
-                        'provider': provider_name,
-                        'model': model_name,
-                        'endpoint': endpoint_name,
-                        'theme': kwargs.get('theme') or (args[0] if args else None),
-                        'input_tokens': 0,
-                        'output_tokens': 0,
-                        'total_tokens': 0,
-                        'estimated_cost': 0.0,
-                        'response_time_ms': response_time,
-                        'success': False,
-                        'error_message': str(e),
-                        'request_id': request_id
-                    }))
+                    _enqueue_log(database_service, LlmCallLog(
+                        provider=provider_name,
+                        model=model_name,
+                        endpoint=endpoint_name,
+                        theme=theme,
+                        input_tokens=0,
+                        output_tokens=0,
+                        total_tokens=0,
+                        estimated_cost=0.0,
+                        response_time_ms=response_time,
+                        success=False,
+                        error_message=str(e),
+                        request_id=request_id
+                    ))
                     raise
             return sync_wrapper
     return decorator
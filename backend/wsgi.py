@@ -5,14 +5,27 @@ Note: FastAPI is ASGI-native, so wsgi.py is optional. Gunicorn with Uvicorn work
 can directly use app:app from app.py
 """
 
-from app import app, database_service, ai_service, pdf_storage_service
+import os
 
-print(f"🚀 Church Games Backend (FastAPI)")
-print(f"📊 AI Provider: {ai_service.provider_name}")
-print(f"💾 Database: {'Enabled' if database_service.is_enabled() else 'Will initialize on first request'}")
-print(f"📁 PDF Storage: {pdf_storage_service.storage_path}")
+from app import app
+
+
+def _print_banner():
+    # Imported here so plain worker spawn skips these lookups
+    from app import database_service, ai_service, pdf_storage_service
+    print("🚀 Church Games Backend (FastAPI)")
+    print(f"📊 AI Provider: {ai_service.provider_name}")
+    print(f"💾 Database: {'Enabled' if database_service.is_enabled() else 'Will initialize on first request'}")
+    print(f"📁 PDF Storage: {pdf_storage_service.storage_path}")
+
+
+# Per-worker banner is opt-in (SHOW_BANNER=1); keeping module load free
+# of side effects speeds up gunicorn worker spawn
+if os.getenv('SHOW_BANNER'):
+    _print_banner()
 
 # Export app for Gunicorn
 # Note: Gunicorn with Uvicorn workers will use this
 if __name__ == '__main__':
+    _print_banner()
     print("⚠️  Run with: ./start.sh or gunicorn -c gunicorn.conf.py app:app")